@@ -1,20 +1,23 @@
 from __future__ import annotations
 
-from typing import Deque, List, MutableMapping, Iterator, Optional
-from collections import deque
+from typing import List, MutableMapping, Optional, Tuple
 import random
+import numpy as np
 
 from Modules import *
+from Modules.io_format import IoNames, IO_DTYPE, WRITE
+from Modules.checkpoint import NO_ITEM
 from conf import include_writes
 
 
-# An avatar holds its current location, next locations (_path and _place_changes),
+# An avatar holds its current location, next locations (_future_path and _place_changes),
 # and its guild (_current_guild and _guild_changes)
 
 
 class Avatar:
-    def __init__(self, avatar_id: str, guilds_changes: Changes[Guild], places_changes: Changes[Place], world: World, debug: bool = False):
+    def __init__(self, avatar_id: str, guilds_changes: Changes[Guild], places_changes: Changes[Place], world: World, debug: bool = False, index: int = 0):
         self._world = world
+        self.index: int = index     # position in the scene's avatars (the order of its lines in the ios of others).
         self._clock = -1
         self.id: str = f'AO_{avatar_id}'
         self._device_name: str = f'A_{avatar_id}'
@@ -25,15 +28,26 @@ class Avatar:
         self._current_location: Optional[Location] = None
         self._place_changes: Changes[Place] = places_changes
 
-        self._future_path: Deque[Location] = deque()   # queue of next locations.
+        # next locations of this vtime, as segments of (location, start second, seconds), and the position in it.
+        self._future_path: List[Tuple[Optional[Location], int, int]] = []
+        self._path_segment: int = 0     # index of the segment of the next second.
+        self._path_second: int = SECONDS_IN_VTIME   # seconds of the path already taken.
 
-        self.debug_path: List[Location] = []
+        self.debug_path: List[List[Tuple[Optional[Location], int, int]]] = []    # the future paths of all vtimes.
         self._debug: bool = debug
 
+        # the ios of the last read set: (location, its version, guild, its version) -> lines without the "device, time, " prefix.
+        self._io_key: Optional[Tuple[Location, int, Optional[Guild], int]] = None
+        self._io_suffixes: List[str] = []
+        self._io_records_key: Optional[Tuple[Location, int, Optional[Guild], int]] = None
+        self._io_records: Optional[np.ndarray] = None
+
         #for writes
         self.loc_updates: MutableMapping[int, Location] = {}
         self.guild_updates = []
         self._avatar_id = avatar_id
+        # its own object is written (its line in the location's io block is replaced by this one).
+        self._own_io_suffix: str = f'{self.id}, {"WRITE" if include_writes else "READ"}\n'
 
     def __str__(self) -> str:
         return f'Avatar(id: {self.id}, guild: {self._current_guild}, location: {self._current_location})'
@@ -41,10 +55,13 @@ class Avatar:
     def clock(self) -> int:
         return self._clock
 
-    # update guild. remove from last guild and insert to the new one.
+    # update guild to the next value of its guild changes.
     def _update_guild(self):
         assert (self._clock + 1) // SECONDS_IN_VTIME == self._guild_changes.vclock() + 1, f'{self.id}: guild changes clock is not synced'
-        guild: Optional[Guild] = self._guild_changes.get_next_val()
+        self._set_guild(self._guild_changes.get_next_val())
+
+    # set guild. remove from last guild and insert to the new one.
+    def _set_guild(self, guild: Optional[Guild]):
         self.guild_updates.clear()
 
         if self._current_guild != guild:
@@ -81,37 +98,131 @@ class Avatar:
         return self._current_location
 
     # advance inner clock by 1 and set its location for the next one.
-    # if no locations found in the _future_path, fill it with the update_future_path() call.
+    # if the whole _future_path was taken, fill it with the update_future_path() call.
     def step(self) -> None:
-        if not self._future_path:
+        if self._path_second == SECONDS_IN_VTIME:
             assert (self._clock + 1) % SECONDS_IN_VTIME == 0
             self._update_guild()
             self._update_future_path()
 
-        self.set_location(self._future_path.popleft())
+        loc, start, seconds = self._future_path[self._path_segment]
+        if self._path_second == start:
+            self.set_location(loc)
+        self._path_second += 1
+        if self._path_second == start + seconds:
+            self._path_segment += 1
         self._clock += 1
 
-    # iterator if all ios the player should read is this second.
-    # itself, its location, the players in that locations, its guild and the guild members.
-    def generate_io(self) -> Iterator[str]:
+    # fast-forward an offline avatar to "clock" (the last second of a vtime) without stepping through every second,
+    #  so its next step() starts the next vtime. returns its place in the vtime that ends at clock.
+    def skip_to(self, clock: int) -> Optional[Place]:
+        assert (clock + 1) % SECONDS_IN_VTIME == 0 and clock >= self._clock, f'{self.id}: cant skip from {self._clock} to {clock}'
+        vclock = (clock + 1) // SECONDS_IN_VTIME - 1
+        self._set_guild(self._guild_changes.skip_to(vclock))
+        place = self._place_changes.skip_to(vclock)
+        self._future_path = []
+        self._path_second = SECONDS_IN_VTIME
+        self.set_location(None)
+        self._clock = clock
+        return place
+
+    # fast-forward the avatar to "clock" (the last second of a vtime) as if the time before it wasn't run - in a random
+    #  location of its place in the vtime that ends at clock (None if it was offline), to start an independent window.
+    def start_window(self, clock: int) -> None:
+        place = self.skip_to(clock)
+        if place is not None:
+            self.set_location(place.get_random_location(None))
+
+    # the state of the avatar for a checkpoint (see Modules/checkpoint.py) - (the fields of AVATAR_DTYPE, the segments
+    #  of its future path, its pending location writes, its guild updates), with locations by their code in the world
+    #  and guilds by guild_codes.
+    def get_state(self, guild_codes: MutableMapping[Guild, int]) -> Tuple[tuple, List[tuple], List[tuple], List[int]]:
+        def loc_code(loc: Optional[Location]) -> int:
+            return NO_ITEM if loc is None else self._world.get_location_code(loc)
+
+        state = (self._clock, *self._guild_changes.get_position(), *self._place_changes.get_position(),
+                 loc_code(self._current_location), NO_ITEM if self._current_guild is None else guild_codes[self._current_guild],
+                 self._path_segment, self._path_second)
+        path = [(loc_code(loc), start, seconds) for loc, start, seconds in self._future_path]
+        loc_updates = [(time, loc_code(loc)) for time, loc in self.loc_updates.items()]
+        return state, path, loc_updates, [guild_codes[g] for g in self.guild_updates]
+
+    # set the state of a new avatar (that didn't step yet) to a state from get_state(). guilds - the guild of each code.
+    def set_state(self, state: np.void, path: np.ndarray, loc_updates: np.ndarray, guild_updates: np.ndarray, guilds: List[Guild]) -> None:
+        def get_loc(code: int) -> Optional[Location]:
+            return None if code == NO_ITEM else self._world.get_location_by_code(code)
+
+        self._guild_changes.set_position(int(state['guild_consumed']), int(state['guild_vclock']))
+        self._place_changes.set_position(int(state['place_consumed']), int(state['place_vclock']))
+        self._clock = int(state['clock'])
+        self.set_location(get_loc(int(state['location'])))
+        self._set_guild(None if state['guild'] == NO_ITEM else guilds[state['guild']])
+        self._future_path = [(get_loc(loc), start, seconds) for loc, start, seconds in path.tolist()]
+        self._path_segment = int(state['path_segment'])
+        self._path_second = int(state['path_second'])
+        self.loc_updates = {time: get_loc(loc) for time, loc in loc_updates.tolist()}
+        self.guild_updates = [guilds[g] for g in guild_updates.tolist()]
+
+    # all ios the player should read is this second (as one string of lines).
+    # itself, its location, the players in that locations, its guild and the guild members (players by their index).
+    # the location's part is its io block, shared by all the avatars there (with this avatar's line changed to WRITE).
+    # the lines are rebuilt only when the location, the guild, or their avatars have changed.
+    def generate_io(self) -> str:
+        suffixes = self.get_io_suffixes()
+        if suffixes is None:
+            return ''
+        prefix = f'{self._device_name}, {self._clock}.0, '
+        return prefix + prefix.join(suffixes)
+
+    # the lines of generate_io() without their device and time ("obj_id, type\n"), None if offline.
+    # the returned list is reused by the next calls.
+    def get_io_suffixes(self) -> Optional[List[str]]:
         loc = self.get_location()
         if not loc:
-            return iter([])
-
-        io_keys = set()
-        io_keys.update(loc.get_avatars_dict().keys())
-        io_keys.add(loc)
+            return None
 
         guild = self.get_guild()
-        if guild:
-            io_keys.add(guild)
-            io_keys.update(guild.get_avatars_dict().keys())
-
-        io_keys = list(io_keys)
-        ops = self._get_ops(io_keys)
+        io_key = (loc, loc.version, guild, guild.version if guild else -1)
+        if io_key != self._io_key:
+            self._io_key = io_key
+            loc_suffixes, loc_indices = loc.get_io_block()
+            own_index = loc_indices[self]
+            self._io_suffixes = loc_suffixes[:own_index]
+            self._io_suffixes.append(self._own_io_suffix)
+            self._io_suffixes.extend(loc_suffixes[own_index + 1:])
+            if guild:
+                loc_avatars = loc.get_avatars_dict()
+                self._io_suffixes.append(f'{guild.id}, READ\n')
+                self._io_suffixes.extend(f'{a.id}, READ\n' for a in guild.get_ordered_avatars() if a not in loc_avatars)
+        return self._io_suffixes
+
+    # same as generate_io(), as records of the binary format (None if offline).
+    # the returned array is reused (and changed) by the next call.
+    def generate_io_records(self, names: IoNames) -> Optional[np.ndarray]:
+        loc = self.get_location()
+        if not loc:
+            return None
 
-        prefix = f'{self._device_name}, {self._clock}.0, '
-        return (f'{prefix}{obj.id}, {ops[ind]}\n' for ind, obj in enumerate(io_keys))
+        guild = self.get_guild()
+        io_key = (loc, loc.version, guild, guild.version if guild else -1)
+        if io_key != self._io_records_key:
+            self._io_records_key = io_key
+            loc_ids, loc_indices = loc.get_io_ids_block(names)
+            guild_ids = []
+            if guild:
+                loc_avatars = loc.get_avatars_dict()
+                guild_ids.append(names.get_id(guild.id))
+                guild_ids.extend(names.get_id(a.id) for a in guild.get_ordered_avatars() if a not in loc_avatars)
+            records = np.zeros(len(loc_ids) + len(guild_ids), dtype=IO_DTYPE)
+            records['device'] = names.get_id(self._device_name)
+            records['object'][:len(loc_ids)] = loc_ids
+            records['object'][len(loc_ids):] = guild_ids
+            if include_writes:
+                records['op'][loc_indices[self]] = WRITE
+            self._io_records = records
+
+        self._io_records['time'] = self._clock
+        return self._io_records
 
     # build the future_path from current location to last_loc (random location from place,
     # taking into account your current location).
@@ -122,8 +233,11 @@ class Avatar:
         assert (self._clock + 1) // SECONDS_IN_VTIME == self._place_changes.vclock() + 1, f'{self.id}: place changes clock is not synced'
         place = self._place_changes.get_next_val()
         self.loc_updates.clear()
+        self._future_path = []
+        self._path_segment = 0
+        self._path_second = 0
         if place is None:
-            self._future_path = deque([None] * SECONDS_IN_VTIME)
+            self._add_path_segment(None, SECONDS_IN_VTIME)
         else:
             if not self._current_location:
                 # was offline
@@ -133,7 +247,7 @@ class Avatar:
 
             if self._current_location == last_loc:
                 # stayed in same location
-                self._future_path = deque([last_loc] * SECONDS_IN_VTIME)
+                self._add_path_segment(last_loc, SECONDS_IN_VTIME)
 
             elif not self._current_location.get_zone().is_neighbor(last_loc.get_zone()):
                 # do not have a common border - used portal
@@ -166,31 +280,30 @@ class Avatar:
                     remaining_time -= seconds_for_loc
                     # change_time += seconds_for_loc
 
-                self._future_path.extend([self._world.get_location(cont, x, y)] * remaining_time)
+                self._add_path_segment(self._world.get_location(cont, x, y), remaining_time)
                 # self._extend_future_path(self._world.get_location(cont, x, y), remaining_time, remaining_time)
 
-        # assert len(self._future_path) == SECONDS_IN_VTIME, f'path length not valid: {len(self._future_path)}'
+        # assert sum(seconds for _, _, seconds in self._future_path) == SECONDS_IN_VTIME, 'path length not valid'
         if self._debug:
-            self.debug_path.extend(self._future_path)
-
-    # return "WRITE" if it's an object generated by this avatar
-    #object_name is of format AO_<avatar_id> and avatar name is of format A_<avatar_id>
-    def _get_ops(self, io_keys) -> []:
-        ops = ["READ"] * len(io_keys)
-        if not include_writes:
-            return ops
-        for ind, obj in enumerate(io_keys):
-            if obj.id == f'AO_{self._avatar_id}':
-                ops[ind] = "WRITE"
-                break
-        return ops
+            self.debug_path.append(self._future_path)
 
     def get_loc_updates(self) -> MutableMapping[int, Location]:
         return self.loc_updates
 
     def _extend_future_path(self, loc: Location, seconds_for_loc: int, remaining_time: int) -> None:
         self.loc_updates[SECONDS_IN_VTIME - remaining_time] = loc
-        self._future_path.extend([loc] * seconds_for_loc)
+        self._add_path_segment(loc, seconds_for_loc)
+
+    # append "seconds" seconds in loc to the end of the path (merged with the last segment if it's the same location).
+    def _add_path_segment(self, loc: Optional[Location], seconds: int) -> None:
+        if seconds <= 0:
+            return
+        if self._future_path and self._future_path[-1][0] == loc:
+            last_loc, start, last_seconds = self._future_path[-1]
+            self._future_path[-1] = (last_loc, start, last_seconds + seconds)
+        else:
+            start = self._future_path[-1][1] + self._future_path[-1][2] if self._future_path else 0
+            self._future_path.append((loc, start, seconds))
 
     def _update_guild_change(self) -> None:
         self.guild_updates.append(self._current_guild)
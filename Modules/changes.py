@@ -1,5 +1,5 @@
 from collections import deque
-from typing import Deque, Tuple, Generic, TypeVar, Optional
+from typing import Deque, Tuple, Generic, TypeVar, Optional, List, Iterable
 
 MINUTE = 60
 MINUTES_IN_VTIME = 10
@@ -19,6 +19,7 @@ class Changes(Generic[T]):
         self._last_change_time: int = -1
         self._last_change_val: Optional[T] = init_val
         self._changes: Deque[Tuple[int, Optional[T]]] = deque()
+        self._consumed: int = 0     # number of changes popped from the queue.
         self._lock_changes: bool = False
 
     def __str__(self) -> str:
@@ -34,6 +35,16 @@ class Changes(Generic[T]):
             # assert self._changes[0][0] >= self._vclock, f'{self._avatar_id}: clock {self._vclock} skipped the next change {self._changes[0][0]}'
             if self._changes[0][0] == self._vclock:
                 self._cur_val = self._changes.popleft()[1]
+                self._consumed += 1
+        return self._cur_val
+
+    # advance the inner-clock straight to vclock (skipping the times in between), and get the value at that time.
+    def skip_to(self, vclock: int) -> Optional[T]:
+        self._lock_changes = True
+        self._vclock = vclock
+        while self._changes and self._changes[0][0] <= vclock:
+            self._cur_val = self._changes.popleft()[1]
+            self._consumed += 1
         return self._cur_val
 
     # register a new change (time must be >= from the last time entered, will be inserted at the end of the queue).
@@ -48,5 +59,31 @@ class Changes(Generic[T]):
             self._changes.append((vtime, val))
             self._last_change_val = val
 
+    # register an already-compressed run of changes at once (sorted by time, no two consecutive equal values).
+    # equivalent to calling register_change() on each one, but without the per-change checks.
+    def register_changes(self, changes: List[Tuple[int, Optional[T]]]) -> None:
+        assert not self._lock_changes, f'{self._avatar_id}: cant register change after lock'
+        if not changes:
+            return
+        assert changes[0][0] >= self._last_change_time, f'{self._avatar_id}: cant register change before last change time (reg:{changes[0][0]}, last:{self._last_change_time})'
+        self._changes.extend(changes)
+        self._last_change_time, self._last_change_val = changes[-1]
+
+    # the position in the timeline - (number of changes consumed, inner-clock).
+    def get_position(self) -> Tuple[int, int]:
+        return self._consumed, self._vclock
+
+    # move a timeline that wasn't used yet to a position from get_position() (of the same changes).
+    def set_position(self, consumed: int, vclock: int) -> None:
+        self._lock_changes = True
+        for _ in range(consumed):
+            self._cur_val = self._changes.popleft()[1]
+        self._consumed = consumed
+        self._vclock = vclock
+
     def vclock(self) -> int:
         return self._vclock
+
+    # the changes not consumed yet, as (vtime, value) ordered by time.
+    def get_changes(self) -> Iterable[Tuple[int, Optional[T]]]:
+        return iter(self._changes)
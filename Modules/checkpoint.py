@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import os
+from typing import List, MutableMapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+
+# A checkpoint of a scene run, taken after each window (Scene{n}/checkpoint_scene{n}.npz), so "run --resume" can
+#  continue from the last window written instead of from the start.
+# Everything is saved as arrays of integers - avatars by their index in the scene, guilds by their index in the
+#  scene's guilds, locations by World.get_location_code() (NO_ITEM for None):
+#  meta            - scene number, seed, length of the run (minutes) and the minute the next window starts at.
+#  ext             - extension of the window files (and the multiplication, see IoMultiplier.get_key()).
+#  rng, rng_gauss  - the state of the random module.
+#  active          - the stepping avatars.
+#  loc_updates     - the pending system writes of locations, as (time, location).
+#  avatars         - the fixed-size state of every avatar (AVATAR_DTYPE).
+#  path, loc_updates_a, guild_updates_a (with *_lens - the number of items of each avatar) - its future path,
+#   pending location writes and guild updates.
+
+
+NO_ITEM = -1
+
+AVATAR_DTYPE = np.dtype([('clock', '<i8'), ('guild_consumed', '<i4'), ('guild_vclock', '<i4'), ('place_consumed', '<i4'),
+                         ('place_vclock', '<i4'), ('location', '<i4'), ('guild', '<i4'), ('path_segment', '<i4'),
+                         ('path_second', '<i4')])
+SEGMENT_DTYPE = np.dtype([('location', '<i4'), ('start', '<i4'), ('seconds', '<i4')])
+LOC_UPDATE_DTYPE = np.dtype([('time', '<i8'), ('location', '<i4')])
+
+
+def checkpoint_file_name(scene_num: int) -> str:
+    return f'checkpoint_scene{scene_num}.npz'
+
+
+# flatten the items of all avatars to one array, and the number of items of each avatar.
+def pack(items: Sequence[Sequence[Union[tuple, int]]], dtype: np.dtype) -> Tuple[np.ndarray, np.ndarray]:
+    lens = np.array([len(i) for i in items], dtype=np.int32)
+    return np.array([item for i in items for item in i], dtype=dtype), lens
+
+
+# the items of each avatar from pack().
+def unpack(flat: np.ndarray, lens: np.ndarray) -> List[np.ndarray]:
+    return np.split(flat, np.cumsum(lens)[:-1])
+
+
+# write to a temporary file and rename it, so the last checkpoint is never left half written.
+def save_checkpoint(path: str, arrays: MutableMapping[str, np.ndarray]) -> None:
+    with open(f'{path}.tmp', 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(f'{path}.tmp', path)
+
+
+def load_checkpoint(path: str) -> Optional[MutableMapping[str, np.ndarray]]:
+    if not os.path.isfile(path):
+        return None
+    with np.load(path) as f:
+        return {name: f[name] for name in f.files}
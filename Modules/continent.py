@@ -1,9 +1,7 @@
 from __future__ import annotations
 
-import os
-from typing import Tuple, MutableMapping, List
+from typing import Tuple, MutableMapping, List, Optional
 from enum import Enum
-import pandas as pd
 import numpy as np
 
 from Modules import *
@@ -17,41 +15,58 @@ class ContinentName(Enum):
 
 
 class Continent:
-    # builds all of this-continent's zones (zones_df), locations, and the connections between them.
-    def __init__(self, name: ContinentName):
-        zones_df = pd.read_csv(os.path.join("Maps", f"{name.value}.csv"), index_col='name', header=0)
-        zones_df.dropna(inplace=True)
-        int_fields = ['tl_x', 'tl_y', 'br_x', 'br_y', 'capitals', 'major cities', 'minor cities']
-        zones_df[int_fields] = zones_df[int_fields].astype(int)
-
+    # a continent of the compiled world (see Modules/world_cache.py) - zones/cities are the zone/city of every location
+    #  (y, x), by their index in the continent (-1 for none). its zones and cities are added by the World.
+    def __init__(self, name: ContinentName, zones: np.ndarray, cities: np.ndarray):
         self._name: ContinentName = name
+        self._letter: str = name.value[0]
         self._zones: MutableMapping[str, zone.Zone] = {}
+        self._zones_list: List[Zone] = []
+        self._cities: List[City] = []
+        self._zone_grid: np.ndarray = zones
+        self._city_grid: np.ndarray = cities
 
-        self._br = (zones_df['br_x'].max(), zones_df['br_y'].max())
+        self._br = (zones.shape[1], zones.shape[0])
+        # a location is created the first time it's used (see get_location()).
         self._locations = np.empty((self._br[1], self._br[0]), dtype=Location)
-
-        # initialize locations (without a city/zone yet).
-        for y in range(self._br[1]):
-            for x in range(self._br[0]):
-                self._locations[y][x] = Location(x, y, f'{name.value[0]}_{x}_{y}')
-
-        # initialize all zones.
-        for _, zone in zones_df.iterrows():
-            z = Zone(zone.name, self, (zone.tl_x, zone.tl_y), (zone.br_x, zone.br_y))
-            self._zones[zone.name] = z
-            for loc in z.get_locations():
-                loc.set_zone(z)
+        # the locations that had avatars since the last reset (the only ones reset() has to clear).
+        self._occupied_locations: MutableMapping[Location, None] = {}
 
     def __str__(self) -> str:
         return f'Continent({self._name.value})'
 
     def reset(self):
-        for x in range(self._br[0]):
-            for y in range(self._br[1]):
-                self.get_location(x, y).reset()
+        for loc in self._occupied_locations:
+            loc.reset()
+        self._occupied_locations.clear()
 
+    # called by a location when its first avatar enters it.
+    def add_occupied_location(self, loc: Location) -> None:
+        self._occupied_locations[loc] = None
+
+    # the location at (x, y) - created the first time it's used.
     def get_location(self, x, y) -> Location:
-        return self._locations[y][x]
+        loc = self._locations[y][x]
+        if loc is None:
+            loc = self._locations[y][x] = Location(self, y * self._br[0] + x)
+        return loc
+
+    # the static fields of the locations, by their index (see Location).
+    def get_location_coords(self, index: int) -> Tuple[int, int]:
+        y, x = divmod(index, self._br[0])
+        return x, y
+
+    def get_location_zone(self, index: int) -> Optional[Zone]:
+        z = self._zone_grid.item(index)
+        return self._zones_list[z] if z >= 0 else None
+
+    def get_location_city(self, index: int) -> Optional[City]:
+        c = self._city_grid.item(index)
+        return self._cities[c] if c >= 0 else None
+
+    def get_location_id(self, index: int) -> str:
+        x, y = self.get_location_coords(index)
+        return f'LO_{self._letter}_{x}_{y}'
 
     def get_name(self) -> ContinentName:
         return self._name
@@ -59,8 +74,14 @@ class Continent:
     def get_bounds(self) -> Tuple[Tuple[int, int], Tuple[int, int]]:
         return (0, 0), self._br
 
+    # add a zone (the next index of the zone grid).
     def add_zone(self, zone: Zone) -> None:
         self._zones[zone.get_name()] = zone
+        self._zones_list.append(zone)
+
+    # add a city (the next index of the city grid).
+    def add_city(self, city: City) -> None:
+        self._cities.append(city)
 
     def is_zone(self, zone: str) -> bool:
         return zone in self._zones
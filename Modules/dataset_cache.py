@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, MutableMapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# The WoWAH dataset, as listed and parsed by "stats" and "build" (see Scripts/stats_calc.py, Scripts/scenes_build.py).
+#  Parsed/timeline.npz  - the timeline index: a row per dataset file (by day and name) - its day (directory), name, time
+#                         (by its name, NaT if it isn't a time), size, mtime (ns), the mtime of its day's directory, and
+#                         its number of good records and the error that stopped its parsing ('' if none) - records is -1
+#                         until the file is parsed by a build. Only the day directories that changed (by mtime) since
+#                         the index was saved are listed again, so the dataset isn't walked by every command ("build"
+#                         also lists the files of the other days, so a file edited in place is parsed again).
+#  Parsed/{day}.npz     - the good records of the day's files (so a build only parses the days that were added or
+#                         changed since the last one, and a build with other --gap/--length only splits the cached
+#                         records into scenes again): the files, the number of records of each and their errors, and
+#                         the records' columns (avatar_id, guild, place) as codes of their names.
+#                         parser - the key of the parsing rules the day was parsed with (a day of other rules is parsed again).
+
+
+PARSED_FOLDER = 'Parsed'
+TIMELINE_FILE = 'timeline.npz'
+TIMELINE_COLUMNS = ['day', 'name', 'time', 'size', 'mtime', 'day_mtime', 'records', 'error']
+FIELDS = ('avatar_id', 'guild', 'place')
+
+# the good records of a file, by column (avatar ids, guild ids, zones), and the error that stopped its parsing (if any).
+FileRecords = Tuple[List[str], List[str], List[str], Optional[str]]
+
+
+def timeline_path() -> str:
+    return os.path.join(PARSED_FOLDER, TIMELINE_FILE)
+
+
+def day_cache_path(day: str) -> str:
+    return os.path.join(PARSED_FOLDER, f'{day}.npz')
+
+
+def is_day(name: str) -> bool:
+    try:
+        datetime.strptime(name, '%Y-%m-%d')
+    except ValueError:
+        return False
+    return True
+
+
+# the day directories under path (by their names), in order.
+def day_dirs(path: str) -> Iterator[os.DirEntry]:
+    with os.scandir(path) as entries:
+        dirs = sorted((entry for entry in entries if entry.is_dir()), key=lambda entry: entry.name)
+    for entry in dirs:
+        if is_day(entry.name):
+            yield entry
+        else:
+            yield from day_dirs(entry.path)
+
+
+# the timeline rows of a day directory (day - its path in the dataset).
+def list_day(path: str, day: str, day_mtime: int) -> pd.DataFrame:
+    with os.scandir(path) as entries:
+        files = sorted((entry for entry in entries if entry.is_file()), key=lambda entry: entry.name)
+    stats = [entry.stat() for entry in files]
+    names = [entry.name for entry in files]
+    times = pd.to_datetime(pd.Series([f'{Path(day).name} {name}' for name in names], dtype=object),
+                           format='%Y-%m-%d %H-%M-%S.txt', errors='coerce')
+    return pd.DataFrame({'day': day, 'name': names,
+                         'time': times.to_numpy().astype('datetime64[s]'),
+                         'size': np.array([stat.st_size for stat in stats], dtype=np.int64),
+                         'mtime': np.array([stat.st_mtime_ns for stat in stats], dtype=np.int64),
+                         'day_mtime': np.int64(day_mtime), 'records': np.int64(-1), 'error': ''}, columns=TIMELINE_COLUMNS)
+
+
+def _read_timeline(data_path: str) -> pd.DataFrame:
+    if os.path.isfile(timeline_path()):
+        with np.load(timeline_path()) as f:
+            if str(f['data_path']) == data_path:
+                return pd.DataFrame({column: f[column] for column in TIMELINE_COLUMNS})
+    return pd.DataFrame({column: [] for column in TIMELINE_COLUMNS})
+
+
+def save_timeline(data_path: str, timeline: pd.DataFrame) -> None:
+    if not os.path.isdir(PARSED_FOLDER):
+        os.mkdir(PARSED_FOLDER)
+    columns = {column: timeline[column].to_numpy() for column in TIMELINE_COLUMNS}
+    for column in ('day', 'name', 'error'):
+        columns[column] = columns[column].astype(str)
+    columns['time'] = columns['time'].astype('datetime64[s]')
+    with open(f'{timeline_path()}.tmp', 'wb') as f:
+        np.savez(f, data_path=np.array(data_path), **columns)
+    os.replace(f'{timeline_path()}.tmp', timeline_path())
+
+
+# the files of two listings of a day are the same (by name, size and mtime).
+def same_files(rows: pd.DataFrame, listed: pd.DataFrame) -> bool:
+    return all(rows[column].tolist() == listed[column].tolist() for column in ('name', 'size', 'mtime'))
+
+
+# the timeline index of the dataset at data_path (sorted by day and name) - the days whose directories changed since
+#  it was saved (or all of them, with refresh) are listed again, and it's saved if any did.
+# a file edited in place doesn't change its day directory's mtime - with check_files, the other days are listed too,
+#  and a day is listed again (unparsed) if any of its files changed size or mtime.
+def load_timeline(data_path: str, refresh: bool = False, check_files: bool = False) -> pd.DataFrame:
+    saved = _read_timeline(data_path) if not refresh else _read_timeline('')
+    saved_days = {day: rows for day, rows in saved.groupby('day', sort=False)}
+    days: List[pd.DataFrame] = []
+    changed = False
+    for entry in day_dirs(data_path):
+        day = os.path.relpath(entry.path, data_path)
+        day_mtime = entry.stat().st_mtime_ns
+        rows = saved_days.pop(day, None)
+        if rows is None or rows['day_mtime'].iat[0] != day_mtime:
+            rows = list_day(entry.path, day, day_mtime)
+            changed = True
+        elif check_files:
+            listed = list_day(entry.path, day, day_mtime)
+            if not same_files(rows, listed):
+                rows = listed
+                changed = True
+        if len(rows):
+            days.append(rows)
+    timeline = pd.concat(days, ignore_index=True) if days else saved.iloc[:0]
+    if changed or saved_days:
+        save_timeline(data_path, timeline)
+    return timeline
+
+
+# save the parsed files of a day [(file, its records)].
+def save_day(day: str, files: List[Tuple[str, FileRecords]], parser: str) -> None:
+    columns: MutableMapping[str, np.ndarray] = {}
+    for i, field in enumerate(FIELDS):
+        codes, names = pd.factorize(pd.Series([name for _, records in files for name in records[i]], dtype=object))
+        columns[field] = codes.astype(np.int32)
+        columns[f'{field}_names'] = np.array(names, dtype=str)
+    path = day_cache_path(day)
+    with open(f'{path}.tmp', 'wb') as f:
+        np.savez_compressed(f, parser=np.array(parser), files=np.array([file for file, _ in files], dtype=str),
+                            counts=np.array([len(records[0]) for _, records in files], dtype=np.int64),
+                            has_error=np.array([records[3] is not None for _, records in files]),
+                            errors=np.array(['' if records[3] is None else records[3] for _, records in files], dtype=str),
+                            **columns)
+    os.replace(f'{path}.tmp', path)
+
+
+# the parsed files of a day [(file, its records)] - None if it wasn't saved with these parsing rules.
+def load_day(day: str, parser: str) -> Optional[List[Tuple[str, FileRecords]]]:
+    path = day_cache_path(day)
+    if not os.path.isfile(path):
+        return None
+    with np.load(path) as f:
+        if str(f['parser']) != parser:
+            return None
+        columns = [f[f'{field}_names'][f[field]].tolist() for field in FIELDS]
+        bounds = np.concatenate(([0], np.cumsum(f['counts']))).tolist()
+        return [(file, (*(column[start:end] for column in columns), error if has_error else None))
+                for file, start, end, has_error, error in zip(f['files'].tolist(), bounds[:-1], bounds[1:],
+                                                              f['has_error'].tolist(), f['errors'].tolist())]
@@ -1,17 +1,21 @@
 from __future__ import annotations
 
-from typing import MutableMapping, AbstractSet
+from operator import attrgetter
+from typing import MutableMapping, AbstractSet, List, Optional
 
 from Modules import *
 
 
 # The Guild role is to know which avatars are in it at all times (like a Set[Avatar]).
+# version is incremented on every change of its avatars (so readers can tell when their cached view is stale).
 
 
 class Guild:
     def __init__(self, guild_id: str):
         self.id: str = f'GO_{guild_id}'
         self._avatars: MutableMapping[Avatar, None] = dict()
+        self.version: int = 0
+        self._ordered_avatars: Optional[List[Avatar]] = None
 
     def __str__(self) -> str:
         avatars_ids = ','.join(a.get_id() for a in self._avatars)
@@ -19,9 +23,13 @@ class Guild:
 
     def add_avatar(self, avatar: Avatar) -> None:
         self._avatars[avatar] = None
+        self.version += 1
+        self._ordered_avatars = None
 
     def remove_avatar(self, avatar: Avatar) -> None:
         del self._avatars[avatar]
+        self.version += 1
+        self._ordered_avatars = None
 
     def get_id(self) -> str:
         return self.id
@@ -32,3 +40,9 @@ class Guild:
 
     def get_avatars_dict(self) -> MutableMapping[Avatar]:
         return self._avatars
+
+    # its avatars by their index in the scene (sorted once per change of its avatars).
+    def get_ordered_avatars(self) -> List[Avatar]:
+        if self._ordered_avatars is None:
+            self._ordered_avatars = sorted(self._avatars, key=attrgetter('index'))
+        return self._ordered_avatars
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import gzip
+import os
+from typing import MutableMapping, List, TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+
+if TYPE_CHECKING:
+    from Modules.location import Location
+
+
+# The binary trace format - each window file (sceneN_t1-t2.bin) is a flat array of fixed-width IO_DTYPE records
+#  (no header, can be read with np.memmap/np.fromfile), in the same order as the lines of the text format.
+# device/object are ids of names (sys, A_x, AO_x, LO_c_x_y, GO_x) kept in the scene's names file (sceneN.names.csv),
+#  with the zone and continent of each location object (empty for the other names).
+
+
+IO_DTYPE = np.dtype([('device', '<i4'), ('time', '<f8'), ('object', '<i4'), ('op', 'u1')])
+OPS: List[str] = ['READ', 'WRITE']
+READ: int = 0
+WRITE: int = 1
+
+
+def names_file_name(scene_num: int) -> str:
+    return f'scene{scene_num}.names.csv'
+
+
+# read a binary window file (memory-mapped if not compressed).
+def read_records(path: str) -> np.ndarray:
+    if path.endswith('.gz'):
+        with gzip.open(path, 'rb') as f:
+            return np.frombuffer(f.read(), dtype=IO_DTYPE)
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=IO_DTYPE)
+    return np.memmap(path, dtype=IO_DTYPE, mode='r')
+
+
+# The ids of all the names (devices and objects) used in a binary trace. An id is given to a name the first time it's used.
+
+
+class IoNames:
+    def __init__(self):
+        self._ids: MutableMapping[str, int] = {}
+        self._names: List[str] = []
+        self._zones: List[str] = []
+        self._continents: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    # get the id of name (a new id if it wasn't used before, with zone and continent if it's a location).
+    def get_id(self, name: str, zone: str = '', continent: str = '') -> int:
+        name_id = self._ids.get(name)
+        if name_id is None:
+            name_id = self._ids[name] = len(self._names)
+            self._names.append(name)
+            self._zones.append(zone)
+            self._continents.append(continent)
+        return name_id
+
+    def get_location_id(self, loc: Location) -> int:
+        name_id = self._ids.get(loc.id)
+        if name_id is None:
+            name_id = self.get_id(loc.id, loc.get_zone().get_name(), loc.get_continent().get_name().value)
+        return name_id
+
+    def get_names(self) -> np.ndarray:
+        return np.array(self._names, dtype=object)
+
+    def save(self, path: str) -> None:
+        df = pd.DataFrame({'name': self._names, 'zone': self._zones, 'continent': self._continents})
+        # noinspection PyTypeChecker
+        df.to_csv(path, index_label='id')
+
+    @staticmethod
+    def load(path: str) -> IoNames:
+        df = pd.read_csv(path, header=0, dtype=str, keep_default_na=False)
+        names = IoNames()
+        for name, zone, continent in zip(df['name'], df['zone'], df['continent']):
+            names.get_id(name, zone, continent)
+        return names
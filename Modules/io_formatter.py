@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from multiprocessing import shared_memory
+from typing import List, MutableMapping, Optional
+
+import numpy as np
+
+from Modules.io_writer import IoWriter
+from conf import include_writes
+
+
+# The formatter side of a parallel scene run (see Scene.run()): the scene is simulated once, and every window is
+#  published as a snapshot - the location code of each avatar (by its index) at each second of the window (NO_CODE if
+#  it has no location) in a shared memory block, and the guild code of each avatar (guilds change only when a vtime
+#  starts, so one row is enough for a window).
+# A formatter process renders the window's text lines from the snapshot - the same lines, in the same order, as
+#  Avatar.generate_io() - and writes (and compresses) the window's file.
+
+
+NO_CODE = -1
+
+# set once in each formatter process by init_formatter().
+_device_names: List[str] = []
+_read_lines: List[str] = []
+_own_lines: List[str] = []
+_blocks: MutableMapping[str, shared_memory.SharedMemory] = {}
+
+
+# the pool's initializer - the ids and device names of the scene's avatars (by their index).
+def init_formatter(avatar_ids: List[str], device_names: List[str]) -> None:
+    global _device_names, _read_lines, _own_lines
+    _device_names = device_names
+    _read_lines = [f'{aid}, READ\n' for aid in avatar_ids]
+    _own_lines = [f'{aid}, {"WRITE" if include_writes else "READ"}\n' for aid in avatar_ids]
+
+
+# the locations array (seconds x avatars) of a snapshot in the shared memory block "block_name".
+# blocks are reused for many windows, so each process attaches to a block only once.
+def get_locations(block_name: str, seconds: int, num_avatars: int) -> np.ndarray:
+    block = _blocks.get(block_name)
+    if block is None:
+        block = _blocks[block_name] = shared_memory.SharedMemory(name=block_name)
+    return np.ndarray((seconds, num_avatars), dtype=np.int32, buffer=block.buf)
+
+
+# render the window's ios from its snapshot and write them to path (gzip if compress is not None, by num_compressors threads).
+# start_clock - the clock of the first second, loc_names/guild_names - the names of the codes,
+#  sys_ios - the system's ios of each second (already rendered by the simulation).
+def format_window(block_name: str, seconds: int, start_clock: int, guilds: List[int], guild_names: List[str],
+                  loc_names: List[str], sys_ios: List[str], path: str, compress: Optional[int], num_compressors: int = 1) -> None:
+    locations = get_locations(block_name, seconds, len(guilds))
+    loc_lines = [f'{name}, READ\n' for name in loc_names]
+    guild_lines = [f'{name}, READ\n' for name in guild_names]
+    guild_members: List[List[int]] = [[] for _ in guild_names]
+    for a, g in enumerate(guilds):
+        if g != NO_CODE:
+            guild_members[g].append(a)
+
+    suffixes: MutableMapping[int, List[str]] = {}
+    online: List[int] = []
+    prev_row = np.full(len(guilds), NO_CODE, dtype=np.int32)
+    with IoWriter(path, False, compress, num_compressors) as f:
+        for second in range(seconds):
+            row = locations[second]
+            changed = np.flatnonzero(row != prev_row)
+            if len(changed):
+                # the lines of an avatar change only if the avatars in its location changed.
+                dirty = np.union1d(row[changed], prev_row[changed])
+                dirty = dirty[dirty != NO_CODE]
+                online_arr = np.flatnonzero(row != NO_CODE)
+                by_location = online_arr[np.argsort(row[online_arr], kind='stable')]
+                sorted_codes = row[by_location]
+                starts = np.searchsorted(sorted_codes, dirty, 'left').tolist()
+                ends = np.searchsorted(sorted_codes, dirty, 'right').tolist()
+                row_list = row.tolist()
+                for code, start, end in zip(dirty.tolist(), starts, ends):
+                    members = by_location[start:end].tolist()
+                    block = [_read_lines[a] for a in members]
+                    block.append(loc_lines[code])
+                    for i, a in enumerate(members):
+                        a_suffixes = block[:i]
+                        a_suffixes.append(_own_lines[a])
+                        a_suffixes.extend(block[i + 1:])
+                        g = guilds[a]
+                        if g != NO_CODE:
+                            a_suffixes.append(guild_lines[g])
+                            a_suffixes.extend(_read_lines[m] for m in guild_members[g] if row_list[m] != code)
+                        suffixes[a] = a_suffixes
+                online = online_arr.tolist()
+                prev_row = row
+
+            clock = start_clock + second
+            io = [sys_ios[second]]
+            for a in online:
+                prefix = f'{_device_names[a]}, {clock}.0, '
+                io.append(prefix + prefix.join(suffixes[a]))
+            f.write(''.join(io))
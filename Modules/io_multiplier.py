@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+from typing import BinaryIO, Iterable, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+
+# Multiplication of text ios (see "multiply"): every io is copied "factor" times, each copy at a uniform random time
+#  in the io's second (to the microsecond, written as %.6f), and the copies are sorted by time.
+# The random offsets of a window are seeded by (seed, scene, first minute of the window), and drawn a minute at a
+#  time - multiplying a window file, or the same ios as they're generated (IoMultiplier), gives the same lines.
+
+
+MICROS = 1_000_000
+
+
+# the rows of a table of strings as bytes, padded with zeros to the longest one (the text never has a zero byte, so
+#  the padding is removed by dropping the zeros).
+def byte_rows(strings: Iterable[str]) -> np.ndarray:
+    table = np.array(list(strings), dtype=object).astype(bytes)
+    return table.view(np.uint8).reshape(len(table), table.itemsize)
+
+
+# "000" - "999", the sub-second digits of a written time are two of these (the second with a ", " after it).
+_DIGITS = byte_rows(f'{i:03d}' for i in range(1000))
+_DIGITS_SEP = byte_rows(f'{i:03d}, ' for i in range(1000))
+
+
+def window_rng(seed: int, scene_num: int, first_minute: int) -> np.random.Generator:
+    return np.random.default_rng([seed % (1 << 64), scene_num, first_minute])
+
+
+# the lines of "factor" copies of every io (by its index), each at a uniform random time in the io's second (to the
+#  microsecond), sorted by time (the copies keep the order of the ios they were made of when their times are equal).
+# times are in microseconds, devices/rests are codes of device_rows ("device, ") and rest_rows ("obj_id, type\n").
+def multiply_ios(indices: np.ndarray, times: np.ndarray, devices: np.ndarray, device_rows: np.ndarray, rests: np.ndarray,
+                 rest_rows: np.ndarray, factor: int, rng: np.random.Generator) -> bytes:
+    indices = np.repeat(indices, factor)
+    new_times = times[indices] + rng.integers(0, MICROS, len(indices))
+    order = np.argsort(new_times, kind='stable')
+    indices, new_times = indices[order], new_times[order]
+    secs, micros = np.divmod(new_times, MICROS)
+    sec_codes, sec_values = pd.factorize(secs)
+    millis, micros = np.divmod(micros, 1000)
+    lines = np.concatenate((device_rows[devices[indices]], byte_rows(f'{s}.' for s in sec_values)[sec_codes],
+                            _DIGITS[millis], _DIGITS_SEP[micros], rest_rows[rests[indices]]), axis=1)
+    return lines[lines != 0].tobytes()
+
+
+# Multiplies the ios of a scene as they're generated (see Scene.run()), instead of writing them and multiplying the
+#  files: the ios of every second are collected (by device), and each minute is written multiplied once it's over.
+class IoMultiplier:
+    # devices - multiply only the ios of these devices (and drop the rest), None for all of them.
+    def __init__(self, factor: int, seed: int, scene_num: int, devices: Optional[Set[str]] = None):
+        self.factor: int = factor
+        self._seed: int = seed
+        self._scene_num: int = scene_num
+        self._devices: Optional[Set[str]] = devices
+        self._rng: Optional[np.random.Generator] = None
+        # the ios of the minute - (clock, device, number of ios) of every device-second, and the rest of their lines.
+        self._clocks: List[int] = []
+        self._device_names: List[str] = []
+        self._counts: List[int] = []
+        self._suffixes: List[str] = []
+
+    # the options that change the output (to tell runs apart).
+    def get_key(self) -> str:
+        return f'x{self.factor}' + (f' {",".join(sorted(self._devices))}' if self._devices is not None else '')
+
+    def start_window(self, first_minute: int) -> None:
+        self._rng = window_rng(self._seed, self._scene_num, first_minute)
+        self._clear()
+
+    # the ios of a device at a second, by the rest of their lines ("obj_id, type\n").
+    def add(self, clock: int, device: str, suffixes: List[str]) -> None:
+        if self._devices is not None and device not in self._devices:
+            return
+        self._clocks.append(clock)
+        self._device_names.append(device)
+        self._counts.append(len(suffixes))
+        self._suffixes.extend(suffixes)
+
+    # write the multiplied ios collected since the last flush (the end of a minute).
+    def flush(self, output_file: BinaryIO) -> None:
+        if not self._suffixes:
+            self._clear()
+            return
+        counts = np.array(self._counts, dtype=np.int64)
+        times = np.repeat(np.array(self._clocks, dtype=np.int64) * MICROS, counts)
+        device_codes, device_names = pd.factorize(np.array(self._device_names, dtype=object))
+        rests, rest_names = pd.factorize(np.array(self._suffixes, dtype=object))
+        output_file.write(multiply_ios(np.arange(len(times)), times, np.repeat(device_codes, counts),
+                                       byte_rows(f'{name}, ' for name in device_names), rests, byte_rows(rest_names),
+                                       self.factor, self._rng))
+        self._clear()
+
+    def _clear(self) -> None:
+        self._clocks.clear()
+        self._device_names.clear()
+        self._counts.clear()
+        self._suffixes.clear()
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import gzip
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Union
+
+
+# A window file written in the background: write() only collects the ios, and every full block is handed to a writer
+#  thread (while the next block is filled), so the simulation doesn't wait for the disk or for compression.
+# With compression, the blocks are compressed by a small pool of threads (zlib releases the GIL), each one to its own
+#  gzip member - a file of several members is a regular gzip file (gzip.open() reads it as one stream).
+# Only a few blocks are in flight at a time - write() blocks when the writer falls behind.
+
+
+BLOCK_SIZE = 1 << 22
+_END = None
+
+
+class IoWriter:
+    def __init__(self, path: str, binary: bool = False, compress: Optional[int] = None, num_compressors: int = 1,
+                 block_size: int = BLOCK_SIZE):
+        self._file = open(path, 'wb')
+        self._binary = binary
+        self._compress = compress
+        self._block_size = block_size
+        self._block: List[Union[str, bytes]] = []
+        self._block_len = 0
+        self._compressors: Optional[ThreadPoolExecutor] = \
+            ThreadPoolExecutor(max_workers=num_compressors) if compress is not None else None
+        # blocks (or their compression futures) in the order they're written.
+        self._blocks: queue.Queue = queue.Queue(maxsize=2 * max(num_compressors, 1))
+        self._error: Optional[BaseException] = None
+        self._writer = threading.Thread(target=self._write_blocks, daemon=True)
+        self._writer.start()
+
+    def __enter__(self) -> IoWriter:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def write(self, data: Union[str, bytes]) -> None:
+        self._block.append(data)
+        self._block_len += len(data)
+        if self._block_len >= self._block_size:
+            self._flush_block()
+
+    # hand the block (and any block left) to the writer, wait for everything to be written and close the file.
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self._flush_block()
+        self._put(_END)
+        self._writer.join()
+        if self._compressors is not None:
+            self._compressors.shutdown()
+        self._file.close()
+        if self._error is not None:
+            raise self._error
+
+    def _flush_block(self) -> None:
+        if not self._block:
+            return
+        block = b''.join(self._block) if self._binary else ''.join(self._block)
+        self._block = []
+        self._block_len = 0
+        self._put(self._compressors.submit(self._compress_block, block) if self._compressors is not None else block)
+
+    def _put(self, item: Union[str, bytes, Future, None]) -> None:
+        if self._error is not None:
+            raise self._error
+        self._blocks.put(item)
+
+    def _compress_block(self, block: Union[str, bytes]) -> bytes:
+        return gzip.compress(block if self._binary else block.encode(), compresslevel=self._compress, mtime=0)
+
+    # the writer thread - write the blocks in order until the end.
+    def _write_blocks(self) -> None:
+        while True:
+            item = self._blocks.get()
+            if item is _END:
+                return
+            if self._error is not None:
+                continue
+            try:
+                if isinstance(item, Future):
+                    item = item.result()
+                self._file.write(item if isinstance(item, bytes) else item.encode())
+            except BaseException as e:
+                self._error = e
@@ -1,70 +1,112 @@
 from __future__ import annotations
 
 from collections import deque
-from typing import MutableMapping, AbstractSet, Tuple, Deque
+from operator import attrgetter
+import numpy as np
+from typing import MutableMapping, AbstractSet, Tuple, Deque, Optional, List
 
 from Modules import *
 
 
 # The Location role is to know which avatars are in it at all times (like a Set[Avatar]).
-# Also - it knows in which zone and city it's found (_city=None for no city).
+# Its static fields (coordinates, zone, city and id) are its continent's - it keeps only its continent and its index
+#  there (y * width + x), and the avatars' dict is created only while it has avatars.
+# version is incremented on every change of its avatars (so readers can tell when their cached view is stale).
+
+
+# the avatars of a location without any (never changed).
+_NO_AVATARS: MutableMapping[Avatar, None] = {}
 
 
 class Location:
-    def __init__(self, x: int, y: int, location_id: str):
-        self.id: str = f'LO_{location_id}'
-        self._x = x
-        self._y = y
-        self._zone = None
-        self._city = None
-        self._avatars: MutableMapping[Avatar, None] = dict()
+    __slots__ = ('_continent', 'index', '_avatars', 'version', '_io_block', '_io_ids_block')
+
+    def __init__(self, continent: Continent, index: int):
+        self._continent: Continent = continent
+        self.index: int = index
+        self._avatars: Optional[MutableMapping[Avatar, None]] = None
+        self.version: int = 0
+        self._io_block: Optional[Tuple[List[str], MutableMapping[Avatar, int]]] = None
+        self._io_ids_block: Optional[Tuple[np.ndarray, MutableMapping[Avatar, int]]] = None
 
     def __str__(self) -> str:
-        avatars_ids = ','.join(a.get_id() for a in self._avatars)
-        return f'Location({self._zone.get_continent()} ({self._x},{self._y}), avatars: [{avatars_ids}])'
+        avatars_ids = ','.join(a.get_id() for a in self.get_avatars())
+        return f'Location({self._continent} {self.get_coords()}, avatars: [{avatars_ids}])'
+
+    @property
+    def id(self) -> str:
+        return self._continent.get_location_id(self.index)
 
     def get_id(self):
         return self.id
 
     def reset(self) -> None:
-        self._avatars.clear()
-
-    def set_city(self, city) -> None:
-        self._city = city
-
-    def set_zone(self, zone) -> None:
-        self._zone = zone
+        self._avatars = None
+        self.version += 1
+        self._io_block = None
+        self._io_ids_block = None
 
     def get_coords(self) -> (int, int):
-        return self._x, self._y
+        return self._continent.get_location_coords(self.index)
 
     def is_city(self) -> bool:
-        return self._city is not None
+        return self._continent.get_location_city(self.index) is not None
 
     def get_city(self) -> City:
-        return self._city
+        return self._continent.get_location_city(self.index)
 
     def get_zone(self) -> Zone:
-        return self._zone
+        return self._continent.get_location_zone(self.index)
 
     def get_continent(self) -> Continent:
-        return self._zone.get_continent()
+        return self._continent
 
     def get_avatars(self) -> AbstractSet[Avatar]:
         # assert all(a.get_location() == self for a in self._avatars)   # uncomment for sanity checks.
-        return self._avatars.keys()
+        return self.get_avatars_dict().keys()
 
     def get_avatars_dict(self) -> MutableMapping[Avatar, None]:
-        return self._avatars
+        return _NO_AVATARS if self._avatars is None else self._avatars
 
     def get_num_avatars(self) -> int:
-        return len(self._avatars)
+        return 0 if self._avatars is None else len(self._avatars)
 
     def add_avatar(self, avatar: Avatar) -> None:
+        if self._avatars is None:
+            self._avatars = {}
+            self._continent.add_occupied_location(self)
         self._avatars[avatar] = None
+        self.version += 1
+        self._io_block = None
+        self._io_ids_block = None
 
     def remove_avatar(self, avatar: Avatar) -> None:
         del self._avatars[avatar]
+        if not self._avatars:
+            self._avatars = None
+        self.version += 1
+        self._io_block = None
+        self._io_ids_block = None
+
+    # the io lines (without the "device, time, " prefix) every avatar here reads - all the avatars in it (by their index)
+    #  and the location itself (all READ), and the index of each avatar's line.
+    # built once per change of its avatars, and shared by all of them.
+    def get_io_block(self) -> Tuple[List[str], MutableMapping[Avatar, int]]:
+        if self._io_block is None:
+            avatars = sorted(self.get_avatars_dict(), key=attrgetter('index'))
+            suffixes = [f'{a.id}, READ\n' for a in avatars]
+            suffixes.append(f'{self.id}, READ\n')
+            self._io_block = suffixes, {a: i for i, a in enumerate(avatars)}
+        return self._io_block
+
+    # same as get_io_block(), as the ids of the objects (for the binary format).
+    def get_io_ids_block(self, names: IoNames) -> Tuple[np.ndarray, MutableMapping[Avatar, int]]:
+        if self._io_ids_block is None:
+            avatars = sorted(self.get_avatars_dict(), key=attrgetter('index'))
+            ids = [names.get_id(a.id) for a in avatars]
+            ids.append(names.get_location_id(self))
+            self._io_ids_block = np.array(ids, dtype=np.int32), {a: i for i, a in enumerate(avatars)}
+        return self._io_ids_block
 
     # return (total_dist, horizontal_queue, vertical_queue),
     #  such that each queue holds the next values to be used if the avatar will go in that direction
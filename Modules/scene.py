@@ -2,17 +2,29 @@ from __future__ import annotations
 
 import os
 import pickle
-from collections import defaultdict
-from typing import MutableMapping, ValuesView, List, TextIO, Set, Tuple, Iterable, Iterator
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from operator import attrgetter
+from typing import MutableMapping, ValuesView, List, TextIO, BinaryIO, Set, Tuple, Iterable, Iterator, Union, Optional, Deque
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from multiprocessing.pool import AsyncResult
 import pandas as pd
 from matplotlib import pyplot as plt, gridspec
 from tqdm import tqdm
 import random
 import matplotlib.animation as ani
 import numpy as np
-import gzip
 
 from Modules import *
+from Modules.scene_cache import load_scene
+from Modules.io_format import IoNames, IO_DTYPE, WRITE, names_file_name
+from Modules.io_formatter import NO_CODE, init_formatter, get_locations, format_window
+from Modules.io_writer import IoWriter
+from Modules.io_multiplier import IoMultiplier
+from Modules.test_data import test_names_file_name, test_window_file_name, save_test_names, save_test_window
+from Modules.checkpoint import NO_ITEM, AVATAR_DTYPE, SEGMENT_DTYPE, LOC_UPDATE_DTYPE, checkpoint_file_name, pack, unpack, \
+    save_checkpoint, load_checkpoint
 from conf import include_writes
 
 
@@ -22,8 +34,8 @@ from conf import include_writes
 class Scene:
     # initialize all avatars, the world, create the location & guild Changes()
     def __init__(self, scene_num: int, output_folder: str, pos: int = 0, world: World = None, seed: int = None, scene_minutes_limit: int = None,
-                 debug_avatar_ids: Set[str] = None, debug_test: bool = False):
-        self._pbar: tqdm = tqdm(total=1, position=pos, desc=f'Scene {scene_num} - Initializing scene')
+                 debug_avatar_ids: Set[str] = None, debug_test: bool = False, show_progress: bool = True):
+        self._pbar: tqdm = tqdm(total=1, position=pos, desc=f'Scene {scene_num} - Initializing scene', disable=not show_progress)
         self._seed: int = seed if seed is not None else scene_num
         self._world: World = world if world else World()
         self._output_folder = output_folder
@@ -34,25 +46,35 @@ class Scene:
         self._scene_num: int = scene_num
         self._pos: int = pos
 
-        # test data
-        # loc_dict:     (time, loc)     -> {ao1, ao2, ao3, ..}
-        # guild_dict:   (time, guild)   -> {ao1, ao2, ao3, ..}
-        # avatar_dict:  (time, avatar)  -> (loc, guild)
+        # test data (see Modules/test_data.py) - the location of every avatar at every second of the window (by codes
+        #  of the window's locations), saved with the avatars' guilds when the window is over.
         self._debug_test: bool = debug_test
-        self._test_loc_dict:    MutableMapping[Tuple[int, str], Set[str]] = defaultdict(lambda: set())
-        self._test_guild_dict:  MutableMapping[Tuple[int, str], Set[str]] = defaultdict(lambda: set())
-        self._test_avatar_dict: MutableMapping[Tuple[int, str], Tuple[str, str]] = {}
+        self._test_dir: str = ''
+        self._test_locations: np.ndarray = np.empty((0, 0), dtype=np.int32)
+        self._test_loc_codes: MutableMapping[Location, int] = {}
+
+        # ids of the devices & objects in the binary format.
+        self._io_names: IoNames = IoNames()
+
+        # checkpoints of the run - the file, the extension of the window files, and the thread that writes them.
+        self._checkpoint_path: str = ''
+        self._checkpoint_ext: str = ''
+        self._checkpoint_writer: Optional[ThreadPoolExecutor] = None
+        self._num_compressors: int = 1
+
+        # multiplies the text ios as they're generated (see Scene.run()), None to write them as they are.
+        self._multiplier: Optional[IoMultiplier] = None
 
         #for writes
-        self._loc_updates: MutableMapping[int, Set[Location]] = {}
-        self._guild_updates = set()
+        # (dicts as ordered sets, so the system writes are in the same order on every run)
+        self._loc_updates: MutableMapping[int, MutableMapping[Location, None]] = {}
+        self._guild_updates: MutableMapping[Guild, None] = {}
 
-        # read scene from csv
+        # read scene (from its binary cache, or from csv)
 
-        dtypes = {'virtual_time': int, 'avatar_id': str, 'place': str, 'guild': str}
-        self._scene_df: pd.DataFrame = pd.read_csv(os.path.join("Scenes", f"scene{scene_num}.csv"), header=0, dtype=dtypes)
+        records, names = load_scene(scene_num)
 
-        self._total_vtime: int = self._scene_df['virtual_time'].max() + 1
+        self._total_vtime: int = int(records['virtual_time'].max()) + 1
         if scene_minutes_limit is None:
             scene_minutes_limit = self._total_vtime * MINUTES_IN_VTIME
         if self._total_vtime * MINUTES_IN_VTIME < scene_minutes_limit:
@@ -60,14 +82,17 @@ class Scene:
                 f'\nWARNING: specified time ({scene_minutes_limit}m) is longer than scene length ({self._total_vtime * MINUTES_IN_VTIME}m). Scene length is being used!\n')
         self._actual_minutes_len: int = min(scene_minutes_limit, self._total_vtime * MINUTES_IN_VTIME)
 
-        self._scene_df: pd.DataFrame = self._scene_df[
-            self._scene_df['virtual_time'] < ((self._actual_minutes_len - 1) // MINUTES_IN_VTIME) + 1]
+        # records are ordered by virtual time.
+        last_vtime = ((self._actual_minutes_len - 1) // MINUTES_IN_VTIME) + 1
+        self._scene_records: np.ndarray = records[:np.searchsorted(records['virtual_time'], last_vtime)]
+        self._scene_names: MutableMapping[str, np.ndarray] = names
         self._clock: int = -1
 
         # get all avatars/guilds ids
 
-        self._avatar_ids:   Iterable[str] = self._scene_df['avatar_id'].unique()
-        self._guild_ids:    Iterable[str] = self._scene_df['guild'][self._scene_df['guild'] != 'NO'].unique()
+        guild_codes = self._scene_records['guild']
+        self._avatar_ids:   Iterable[str] = names['avatar_id'][pd.unique(self._scene_records['avatar_id'])]
+        self._guild_ids:    Iterable[str] = names['guild'][pd.unique(guild_codes[guild_codes >= 0])]
 
         all_avatars = set(self._avatar_ids)
 
@@ -89,42 +114,98 @@ class Scene:
 
         # create all guild/location changes
 
-        guilds_changes: MutableMapping[str, Changes[Guild]] = {}
-        places_changes: MutableMapping[str, Changes[Place]] = {}
-        for aid in self._avatar_ids:
-            guilds_changes[aid] = Changes(aid)
-            places_changes[aid] = Changes(aid)
-
-        last_vtime = -1
         self._pbar.set_description(f'Scene {self._scene_num} - reading scene')
-        self._pbar.reset(total=len(self._scene_df))
-
-        for _, row in self._scene_df.iterrows():
-            if row.virtual_time > last_vtime:
-                for aid in all_avatars:     # set all non-active avatars' location to None
-                    places_changes[aid].register_change(last_vtime, None)
-                all_avatars = set(self._avatar_ids)
-                last_vtime = row.virtual_time
-            all_avatars.discard(row.avatar_id)
-
-            # register changes
-            if row.guild != 'NO':
-                guilds_changes[row.avatar_id].register_change(row.virtual_time, self._guilds[row.guild])
-            else:
-                guilds_changes[row.avatar_id].register_change(row.virtual_time, None)
-            places_changes[row.avatar_id].register_change(row.virtual_time, self._world.get_place(row.place))
-
-            self._pbar.update()
-
-        for aid in all_avatars:     # set all non-active avatars' location to None
-            places_changes[aid].register_change(last_vtime, None)
+        guilds_changes, places_changes = self._read_changes()
 
         # create all avatars (with changes).
         self._pbar.set_description(f'Scene {self._scene_num} - creating avatars')
-        for aid in self._avatar_ids:
-            self._avatars[aid] = Avatar(aid, guilds_changes[aid], places_changes[aid], self._world, debug=(aid in self._debug_avatar_ids))
+        for i, aid in enumerate(self._avatar_ids):
+            self._avatars[aid] = Avatar(aid, guilds_changes[aid], places_changes[aid], self._world, debug=(aid in self._debug_avatar_ids), index=i)
+
+        # online avatars (the only ones that step), kept in the avatars' order, and the vtimes they log in/off.
+        # followed avatars always step (their path is needed for the gif).
+        self._active_avatars: List[Avatar] = []
+        self._logins: MutableMapping[int, List[Avatar]] = defaultdict(list)
+        self._logoffs: MutableMapping[int, List[Avatar]] = defaultdict(list)
+        for aid, a in self._avatars.items():
+            if aid in self._debug_avatar_ids:
+                continue
+            last_place = None
+            for vtime, place in places_changes[aid].get_changes():
+                if place is None:
+                    self._logoffs[vtime].append(a)
+                elif last_place is None:
+                    self._logins[vtime].append(a)
+                last_place = place
         self.reset()
 
+    # build the guild & place Changes() of every avatar from the scene's columns (instead of row by row).
+    # in each vtime only the first record of an avatar counts, an avatar missing from a vtime that appears in the scene
+    #  is offline (place None) and keeps its guild, and only actual changes of value are registered.
+    def _read_changes(self) -> Tuple[MutableMapping[str, Changes[Guild]], MutableMapping[str, Changes[Place]]]:
+        records, names = self._scene_records, self._scene_names
+        aids, aid_names = pd.factorize(records['avatar_id'])
+        pids, place_names = pd.factorize(records['place'])
+        gids = np.asarray(records['guild'])     # 'NO' is -1
+        vtimes = np.asarray(records['virtual_time'])
+        aid_names = names['avatar_id'][aid_names]
+
+        # objects by code, the last one (code -1) is None.
+        places = np.array([self._world.get_place(p) for p in names['place'][place_names]] + [None], dtype=object)
+        guilds = np.array([self._guilds.get(g) for g in names['guild']] + [None], dtype=object)
+
+        # index of every record's vtime among the vtimes found in the scene.
+        scene_vtimes = np.unique(vtimes)
+        vinds = np.searchsorted(scene_vtimes, vtimes)
+
+        # first record of each (avatar, vtime), grouped by avatar.
+        order = np.lexsort((vinds, aids))
+        aids, vinds, pids, gids = aids[order], vinds[order], pids[order], gids[order]
+        first = np.ones(len(aids), dtype=bool)
+        first[1:] = (aids[1:] != aids[:-1]) | (vinds[1:] != vinds[:-1])
+        aids, vinds, pids, gids = aids[first], vinds[first], pids[first], gids[first]
+
+        new_avatar = np.ones(len(aids), dtype=bool)
+        new_avatar[1:] = aids[1:] != aids[:-1]
+        last_of_avatar = np.ones(len(aids), dtype=bool)
+        last_of_avatar[:-1] = new_avatar[1:]
+        came_online = new_avatar.copy()
+        came_online[1:] |= vinds[1:] != vinds[:-1] + 1
+        went_offline = np.zeros(len(aids), dtype=bool)
+        went_offline[:-1] = came_online[1:] & ~new_avatar[1:]
+        went_offline |= last_of_avatar & (vinds < len(scene_vtimes) - 1)
+
+        # place changes: new place (or back online), and None right after each record followed by an offline vtime.
+        place_prev = np.full(len(aids), -1)
+        place_prev[1:] = pids[:-1]
+        changed = came_online | (pids != place_prev)
+        p_aids = np.concatenate((aids[changed], aids[went_offline]))
+        p_vinds = np.concatenate((vinds[changed], vinds[went_offline] + 1))
+        p_pids = np.concatenate((pids[changed], np.full(np.count_nonzero(went_offline), -1)))
+        order = np.lexsort((p_vinds, p_aids))
+        p_aids, p_vtimes, p_vals = p_aids[order], scene_vtimes[p_vinds[order]], places[p_pids[order]]
+
+        # guild changes: only when seen with a different guild (offline avatars keep their guild).
+        guild_prev = np.full(len(aids), -1)
+        guild_prev[1:] = np.where(new_avatar[1:], -1, gids[:-1])
+        changed = gids != guild_prev
+        g_aids, g_vtimes, g_vals = aids[changed], scene_vtimes[vinds[changed]], guilds[gids[changed]]
+
+        self._pbar.reset(total=len(aid_names))
+        guilds_changes: MutableMapping[str, Changes[Guild]] = {}
+        places_changes: MutableMapping[str, Changes[Place]] = {}
+        p_bounds = np.searchsorted(p_aids, np.arange(len(aid_names) + 1))
+        g_bounds = np.searchsorted(g_aids, np.arange(len(aid_names) + 1))
+        for i, aid in enumerate(aid_names):
+            guilds_changes[aid] = Changes(aid)
+            places_changes[aid] = Changes(aid)
+            s, e = g_bounds[i], g_bounds[i + 1]
+            guilds_changes[aid].register_changes(list(zip(g_vtimes[s:e].tolist(), g_vals[s:e].tolist())))
+            s, e = p_bounds[i], p_bounds[i + 1]
+            places_changes[aid].register_changes(list(zip(p_vtimes[s:e].tolist(), p_vals[s:e].tolist())))
+            self._pbar.update()
+        return guilds_changes, places_changes
+
     # reset scene
     def reset(self) -> None:
         random.seed(self._seed)
@@ -132,13 +213,16 @@ class Scene:
         self._world.reset()
         for a in self._avatars.values():
             assert a.clock() == -1, f'{a.get_id()} clock is not synced'
+        self._active_avatars = [self._avatars[aid] for aid in self._avatar_ids if aid in self._debug_avatar_ids]
 
     # all avatars take a step.
     # if debug_test is on - record the current state for testing purposes.
     # if following avatars with "_debug_avatar_ids" and SECONDS_IN_VTIME seconds passed since the last time -
     #  create an updated gif.
     def step(self) -> None:
-        for a in self._avatars.values():
+        if (self._clock + 1) % SECONDS_IN_VTIME == 0:
+            self._update_active_avatars()
+        for a in self._active_avatars:
             # assert a.clock() == self._clock, f'{a.get_id()} clock is not synced'
             a.step()
         self._clock += 1
@@ -152,85 +236,360 @@ class Scene:
             self._debug_gif()
 
     # generate all ios from this second, and write it to the output_file.
-    def generate_io(self, output_file: TextIO) -> None:
+    # with a multiplier - the ios go to it, and output_file (binary) gets the multiplied ios of each minute once it's over.
+    def generate_io(self, output_file: Union[TextIO, BinaryIO]) -> None:
+        if self._multiplier is not None:
+            self._multiply_io(output_file)
+            return
         io: List[str] = []
         if include_writes:
             io.extend(self.generate_io_sys())
-        for a in self._avatars.values():
-            io.extend(a.generate_io())
+        for a in self._active_avatars:
+            io.append(a.generate_io())
         output_file.write(''.join(io))
 
+    def _multiply_io(self, output_file: BinaryIO) -> None:
+        if include_writes:
+            self._multiplier.add(self._clock, 'sys', [f'{obj.id}, WRITE\n' for obj in self._sys_updates()])
+        for a in self._active_avatars:
+            suffixes = a.get_io_suffixes()
+            if suffixes is not None:
+                self._multiplier.add(self._clock, a.get_device_name(), suffixes)
+        if self._clock % MINUTE == MINUTE - 1:
+            self._multiplier.flush(output_file)
+
+    # same as generate_io(), in the binary format (see Modules/io_format.py).
+    def generate_io_records(self, output_file: BinaryIO) -> None:
+        records = self._io_records()
+        if len(records):
+            output_file.write(records.tobytes())
+
+    # all ios from this second, as records of the binary format.
+    def _io_records(self) -> np.ndarray:
+        records: List[np.ndarray] = []
+        if include_writes:
+            records.append(self.generate_io_sys_records())
+        for a in self._active_avatars:
+            avatar_records = a.generate_io_records(self._io_names)
+            if avatar_records is not None:
+                records.append(avatar_records)
+        return np.concatenate(records) if records else np.empty(0, dtype=IO_DTYPE)
+
+    # run the scene like run() (the same seeding, and the same ios), without writing anything - yields the ios of
+    #  every second as an array of IO_DTYPE records, with device/object ids of get_io_names().
+    # a yielded array isn't changed by the next ones.
+    def iter_ios(self, independent_windows: bool = False) -> Iterator[np.ndarray]:
+        self.reset()
+        for start_time in range(0, self._actual_minutes_len, MINUTES_IN_VTIME):
+            end_time: int = min(start_time + MINUTES_IN_VTIME, self._actual_minutes_len)
+            if independent_windows:
+                self._start_window(start_time)
+            self._loc_updates.clear()
+            for _ in range(start_time * MINUTE, end_time * MINUTE):
+                self.step()
+                yield self._io_records()
+
+    # the names of the ids in the records (of generate_io_records() and iter_ios()).
+    def get_io_names(self) -> IoNames:
+        return self._io_names
+
     # run the scene. Each second take a step and generate all ios. Save all ios to output files under scene_dir/.
     #  for example, Scene7/scene_10-19.txt.
+    # io_format is 'txt' or 'bin' (binary records, with the names of their ids in Scene7/scene7.names.csv).
+    # num_formatters > 0 (text only) - the scene is simulated here, and the windows are rendered and written by
+    #  that many formatter processes (see Modules/io_formatter.py). The output is the same as the serial run.
+    # a checkpoint is saved after every window - resume continues from it (with the same output as a whole run).
+    # independent_windows - every window has its own random stream and starts from the scene's timelines instead of
+    #  the end of the window before it (see _start_window()), so the windows can be run in any order. With num_formatters > 0
+    #  they're run by that many processes, instead of formatters (text only). No checkpoints are saved.
+    # the files are written in the background, and compressed by num_compressors threads (see Modules/io_writer.py).
+    # factor > 1 or multiply_avatars (text only) - the ios are multiplied as they're generated, like "multiply" does to
+    #  the files of a run with the scene's seed, and only the multiplied files (multiplied-{factor}-scene7_10-19.txt) are
+    #  written (see Modules/io_multiplier.py). The scene is then simulated and written by one process (no formatters).
     # updates a tqdm progress bar.
-    def run(self, keep_output: bool = False, compress: int = None) -> None:
+    def run(self, keep_output: bool = False, compress: int = None, io_format: str = 'txt', num_formatters: int = 0,
+            resume: bool = False, independent_windows: bool = False, num_compressors: int = 1, factor: int = 1,
+            multiply_avatars: Optional[Iterable[str]] = None) -> None:
         self.reset()
+        self._num_compressors = num_compressors
+        self._multiplier = None
+        if io_format == 'txt' and (factor > 1 or multiply_avatars):
+            self._multiplier = IoMultiplier(factor, self._seed, self._scene_num,
+                                            {f'A_{aid}' for aid in multiply_avatars} if multiply_avatars else None)
+        keep_output = keep_output or resume
         if not os.path.isdir(self._output_folder):
             os.mkdir(self._output_folder)
         scene_dir: str = os.path.join(self._output_folder, f'Scene{self._scene_num}')
-        test_data_path = os.path.join(scene_dir, f"test_data_scene{self._scene_num}.pickle")
         if not os.path.isdir(scene_dir):
             os.mkdir(scene_dir)
         elif not keep_output:
             for file in os.listdir(scene_dir):
                 os.remove(os.path.join(scene_dir, file))
 
-        if not keep_output and os.path.isfile(test_data_path):
-            os.remove(test_data_path)
+        if self._debug_test:
+            self._test_dir = scene_dir
+            avatars = self._avatars.values()
+            save_test_names(os.path.join(scene_dir, test_names_file_name(self._scene_num)), [a.id for a in avatars],
+                            [a.get_device_name() for a in avatars])
 
         self._pbar.reset(total=self._actual_minutes_len)
         self._pbar.set_description(f'Scene {self._scene_num}')
-        ext = 'txt' if compress is None else 'txt.gz'
-        pad = len(str(self._actual_minutes_len - 1))
+        ext = io_format if compress is None else f'{io_format}.gz'
+        binary = io_format == 'bin'
+        names_path = os.path.join(scene_dir, names_file_name(self._scene_num))
+        self._checkpoint_path = os.path.join(scene_dir, checkpoint_file_name(self._scene_num))
+        self._checkpoint_ext = ext if self._multiplier is None else f'{ext} {self._multiplier.get_key()}'
+        file_prefix = '' if self._multiplier is None else f'multiplied-{self._multiplier.factor}-'
+        first_minute = 0
+        if resume and not independent_windows:
+            checkpoint = load_checkpoint(self._checkpoint_path)
+            if checkpoint is None:
+                print(f'\nWARNING: no checkpoint in {scene_dir}. Running from the start!\n')
+            elif not self._is_checkpoint_of_run(checkpoint):
+                print(f'\nWARNING: the checkpoint in {scene_dir} is of a different run (seed, limit or format). Running from the start!\n')
+            else:
+                first_minute = self._set_checkpoint(checkpoint)
+                if binary:
+                    self._io_names = IoNames.load(names_path)
+                self._pbar.update(first_minute)
 
-        for start_time in range(0, self._actual_minutes_len, MINUTES_IN_VTIME):
-            self._loc_updates.clear()
+        pad = len(str(self._actual_minutes_len - 1))
+        windows: List[Tuple[int, int, str]] = []
+        for start_time in range(first_minute, self._actual_minutes_len, MINUTES_IN_VTIME):
             end_time: int = min(start_time + MINUTES_IN_VTIME, self._actual_minutes_len)
             pad_start_time = str(start_time).zfill(pad)
             pad_end_time = str(end_time - 1).zfill(pad)
-            path: str = os.path.join(scene_dir, f'scene{self._scene_num}_{pad_start_time}-{pad_end_time}.{ext}')
+            path: str = os.path.join(scene_dir, f'{file_prefix}scene{self._scene_num}_{pad_start_time}-{pad_end_time}.{ext}')
+            windows.append((start_time, end_time, path))
+
+        # checkpoints are written by another thread, in the order they were taken.
+        self._checkpoint_writer = ThreadPoolExecutor(max_workers=1)
+        try:
+            if independent_windows and num_formatters > 0 and not binary:
+                self._run_windows_pool(windows, compress, num_formatters)
+            elif num_formatters > 0 and not binary and not independent_windows and self._multiplier is None:
+                self._run_formatters(windows, compress, num_formatters)
+            else:
+                self._run_serial(windows, compress, binary, names_path, independent_windows)
+        finally:
+            self._checkpoint_writer.shutdown()
+
+        self._pbar.close()
 
-            with open(path, 'w') if compress is None else gzip.open(path, 'wt', compresslevel=compress) as f:
+        if self._debug_test:
+            print(f'Test debug data saved!  ({os.path.join(scene_dir, test_names_file_name(self._scene_num))} and a file per window)')
+
+    # simulate and write the windows (start_time, end_time, path) one after the other.
+    def _run_serial(self, windows: List[Tuple[int, int, str]], compress: Optional[int], binary: bool, names_path: str,
+                    independent_windows: bool = False) -> None:
+        generate_io = self.generate_io_records if binary else self.generate_io
+        for start_time, end_time, path in windows:
+            if independent_windows:
+                self._start_window(start_time)
+            if self._multiplier is not None:
+                self._multiplier.start_window(start_time)
+            self._loc_updates.clear()
+            with IoWriter(path, binary or self._multiplier is not None, compress, self._num_compressors) as f:
                 for _ in range(start_time * MINUTE, end_time * MINUTE):
                     self.step()
-                    self.generate_io(f)
+                    generate_io(f)
+            if binary:
+                self._io_names.save(names_path)
+            if not independent_windows:
+                self._save_checkpoint(self._get_checkpoint(end_time))
 
             self._pbar.update((end_time - start_time))
             self._pbar.refresh()
 
-        self._pbar.close()
-
-        if self._debug_test:
-            with open(test_data_path, 'wb') as pickle_f:
-                pickle.dump((self._test_avatar_dict, dict(self._test_loc_dict), dict(self._test_guild_dict)), pickle_f)
-            print(f'Test debug data saved!  ({test_data_path})')
+    # simulate the windows (start_time, end_time, path), and hand each one as a snapshot to a pool of formatters.
+    # the snapshots are in a ring of shared memory blocks - a block is reused once the window in it was written,
+    #  so the simulation is never more than a few windows ahead of the formatters.
+    def _run_formatters(self, windows: List[Tuple[int, int, str]], compress: Optional[int], num_formatters: int) -> None:
+        avatars = list(self._avatars.values())
+        blocks = [shared_memory.SharedMemory(create=True, size=max(SECONDS_IN_VTIME * len(avatars) * 4, 1))
+                  for _ in range(2 * num_formatters)]
+        pending: List[Optional[AsyncResult]] = [None] * len(blocks)
+        # the checkpoint after each window, saved once the window (and all the ones before it) was written.
+        checkpoints: Deque[Tuple[AsyncResult, MutableMapping[str, np.ndarray]]] = deque()
+        pool = mp.Pool(processes=num_formatters, initializer=init_formatter,
+                       initargs=([a.id for a in avatars], [a.get_device_name() for a in avatars]))
+        try:
+            for i, (start_time, end_time, path) in enumerate(windows):
+                slot = i % len(blocks)
+                if pending[slot] is not None:
+                    pending[slot].get()
+                self._loc_updates.clear()
+                seconds = (end_time - start_time) * MINUTE
+                locations = get_locations(blocks[slot].name, seconds, len(avatars))
+                locations.fill(NO_CODE)
+                loc_codes: MutableMapping[Location, int] = {}
+                sys_ios: List[str] = []
+                for second in range(seconds):
+                    self.step()
+                    sys_ios.append(''.join(self.generate_io_sys()) if include_writes else '')
+                    indices, codes = [], []
+                    for a in self._active_avatars:
+                        loc = a.get_location()
+                        if loc:
+                            code = loc_codes.get(loc)
+                            if code is None:
+                                code = loc_codes[loc] = len(loc_codes)
+                            indices.append(a.index)
+                            codes.append(code)
+                    locations[second, indices] = codes
+
+                guild_codes: MutableMapping[Guild, int] = {}
+                guilds = [NO_CODE if a.get_guild() is None else guild_codes.setdefault(a.get_guild(), len(guild_codes))
+                          for a in avatars]
+                pending[slot] = pool.apply_async(format_window, (blocks[slot].name, seconds, start_time * MINUTE, guilds,
+                                                                 [g.id for g in guild_codes], [loc.id for loc in loc_codes],
+                                                                 sys_ios, path, compress, self._num_compressors))
+                checkpoints.append((pending[slot], self._get_checkpoint(end_time)))
+                while checkpoints and checkpoints[0][0].ready():
+                    result, checkpoint = checkpoints.popleft()
+                    result.get()
+                    self._save_checkpoint(checkpoint)
+                self._pbar.update((end_time - start_time))
+                self._pbar.refresh()
+            for result, checkpoint in checkpoints:
+                result.get()
+                self._save_checkpoint(checkpoint)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    # run the independent windows (start_time, end_time, path) by a pool of processes, each with its own copy of the
+    #  scene (a process runs its windows in order, so it only moves forward in the scene's timelines).
+    def _run_windows_pool(self, windows: List[Tuple[int, int, str]], compress: Optional[int], num_procs: int) -> None:
+        scene_args = (self._scene_num, self._output_folder, self._seed, self._actual_minutes_len, self._multiplier)
+        with mp.Pool(processes=num_procs, initializer=_init_window_worker, initargs=(scene_args,)) as pool:
+            for start_time, end_time in pool.imap(_run_window, ((window, compress, self._num_compressors) for window in windows)):
+                self._pbar.update((end_time - start_time))
+                self._pbar.refresh()
+
+    # start the window at start_time without running the ones before it: the random stream is seeded by the scene's
+    #  seed and the window's index (so the window is the same in every run, whatever ran before it), and every
+    #  avatar is placed by its timelines (see Avatar.start_window()).
+    def _start_window(self, start_time: int) -> None:
+        random.seed(f'{self._seed}/{start_time // MINUTES_IN_VTIME}')
+        clock = start_time * MINUTE - 1
+        for a in self._avatars.values():
+            a.start_window(clock)
+        self._active_avatars = [a for aid, a in self._avatars.items() if aid in self._debug_avatar_ids or a.get_location()]
+        self._clock = clock
+
+    # the state of the scene after the window that ends at end_time (see Modules/checkpoint.py).
+    def _get_checkpoint(self, end_time: int) -> MutableMapping[str, np.ndarray]:
+        guild_codes = {g: i for i, g in enumerate(self._guilds.values())}
+        states = [a.get_state(guild_codes) for a in self._avatars.values()]
+        rng_version, rng_state, rng_gauss = random.getstate()
+        checkpoint = {
+            'meta': np.array([self._scene_num, self._seed, self._actual_minutes_len, end_time], dtype=np.int64),
+            'ext': np.array(self._checkpoint_ext),
+            'rng': np.array((rng_version, *rng_state), dtype=np.int64),
+            'rng_gauss': np.array(np.nan if rng_gauss is None else rng_gauss),
+            'active': np.array([a.index for a in self._active_avatars], dtype=np.int32),
+            'loc_updates': np.array([(time, self._world.get_location_code(loc)) for time, locs in self._loc_updates.items()
+                                     if time > self._clock for loc in locs], dtype=LOC_UPDATE_DTYPE),
+            'avatars': np.array([state for state, _, _, _ in states], dtype=AVATAR_DTYPE),
+        }
+        checkpoint['path'], checkpoint['path_lens'] = pack([path for _, path, _, _ in states], SEGMENT_DTYPE)
+        checkpoint['loc_updates_a'], checkpoint['loc_updates_a_lens'] = pack([u for _, _, u, _ in states], LOC_UPDATE_DTYPE)
+        checkpoint['guild_updates_a'], checkpoint['guild_updates_a_lens'] = pack([u for _, _, _, u in states], np.dtype('<i4'))
+        return checkpoint
+
+    def _save_checkpoint(self, checkpoint: MutableMapping[str, np.ndarray]) -> None:
+        self._checkpoint_writer.submit(save_checkpoint, self._checkpoint_path, checkpoint)
+
+    # was the checkpoint taken in a run like this one (same scene, seed, length and format).
+    def _is_checkpoint_of_run(self, checkpoint: MutableMapping[str, np.ndarray]) -> bool:
+        scene_num, seed, minutes_len, _ = checkpoint['meta'].tolist()
+        return (scene_num, seed, minutes_len) == (self._scene_num, self._seed, self._actual_minutes_len) and \
+            str(checkpoint['ext']) == self._checkpoint_ext and len(checkpoint['avatars']) == len(self._avatars)
+
+    # set the state of the (just reset) scene to the checkpoint, and get the minute to continue from.
+    def _set_checkpoint(self, checkpoint: MutableMapping[str, np.ndarray]) -> int:
+        rng = checkpoint['rng'].tolist()
+        rng_gauss = float(checkpoint['rng_gauss'])
+        random.setstate((rng[0], tuple(rng[1:]), None if np.isnan(rng_gauss) else rng_gauss))
+        guilds = list(self._guilds.values())
+        avatars = list(self._avatars.values())
+        paths = unpack(checkpoint['path'], checkpoint['path_lens'])
+        loc_updates = unpack(checkpoint['loc_updates_a'], checkpoint['loc_updates_a_lens'])
+        guild_updates = unpack(checkpoint['guild_updates_a'], checkpoint['guild_updates_a_lens'])
+        for i, a in enumerate(avatars):
+            a.set_state(checkpoint['avatars'][i], paths[i], loc_updates[i], guild_updates[i], guilds)
+        self._active_avatars = [avatars[i] for i in checkpoint['active'].tolist()]
+        self._loc_updates.clear()
+        for time, loc in checkpoint['loc_updates'].tolist():
+            self._loc_updates.setdefault(time, {})[self._world.get_location_by_code(loc)] = None
+        end_time = int(checkpoint['meta'][3])
+        self._clock = end_time * MINUTE - 1
+        return end_time
 
     # takes loc_updates from each avatar and merges into a single dict.
     # make fast and efficient as possible
     def _merge_loc_updates(self):
         if self._clock % SECONDS_IN_VTIME != 0:
             return
-        for a in self._avatars.values():
+        for a in self._active_avatars:
             for time, loc in a.loc_updates.items():
-                self._loc_updates.setdefault(time + self._clock, set()).add(loc)
+                self._loc_updates.setdefault(time + self._clock, {})[loc] = None
             a.loc_updates.clear()
 
     # get guild updates for each avatar and collect into a single set.
     def merge_guild_updates(self):
         self._guild_updates.clear()
-        for a in self._avatars.values():
+        for a in self._active_avatars:
             self._update_guild(a)
 
+    # at the start of a vtime: avatars that log off take their last step (leaving their location) and stop stepping,
+    #  avatars that log in skip the time they were offline and start stepping.
+    def _update_active_avatars(self) -> None:
+        vtime = (self._clock + 1) // SECONDS_IN_VTIME
+        logoffs = self._logoffs.get(vtime, [])
+        logins = self._logins.get(vtime, [])
+        for a in logoffs:
+            a.step()
+        for a in logins:
+            a.skip_to(self._clock)
+        if logoffs:
+            logoffs_set = set(logoffs)
+            self._active_avatars = [a for a in self._active_avatars if a not in logoffs_set]
+        if logins:
+            self._active_avatars.extend(logins)
+            self._active_avatars.sort(key=attrgetter('index'))
+
 
     # iterator if all ios the player should read is this second.
     # this routine generates the writes made by the system
     def generate_io_sys(self) -> Iterator[str]:
-        updates = self._loc_updates.get(self._clock, set())
-        updates.update(self._guild_updates)
+        updates = self._sys_updates()
 
         prefix = f'sys, {self._clock}.0, '
         return (f'{prefix}{obj.id}, WRITE\n' for obj in updates)
 
+    # same as generate_io_sys(), as records of the binary format.
+    def generate_io_sys_records(self) -> np.ndarray:
+        updates = self._sys_updates()
+        records = np.zeros(len(updates), dtype=IO_DTYPE)
+        records['device'] = self._io_names.get_id('sys')
+        records['time'] = self._clock
+        records['object'] = [self._io_names.get_location_id(obj) if isinstance(obj, Location) else self._io_names.get_id(obj.id)
+                             for obj in updates]
+        records['op'] = WRITE
+        return records
+
+    # all the objects written by the system this second (locations a player has moved to, and updated guilds).
+    def _sys_updates(self) -> MutableMapping[Union[Location, Guild], None]:
+        updates = self._loc_updates.get(self._clock, {})
+        updates.update(self._guild_updates)
+        return updates
+
     # Guild object write occurs if there was update at a guild member list
     # Update probability is # guild members / #avatars
     def _update_guild(self, a: Avatar) -> None:
@@ -238,7 +597,7 @@ class Scene:
             guild_avatar_share = len(g.get_avatars_dict().keys()) / len(self._avatars)
             update_prob = random.uniform(0, 1)
             if update_prob < guild_avatar_share or self._clock == 0:
-                self._guild_updates.add(g)
+                self._guild_updates[g] = None
 
     def get_world(self) -> World:
         return self._world
@@ -272,11 +631,11 @@ class Scene:
             xs: MutableMapping[ContinentName, List[int]] = self._debug_avatars_xs[aid]
             ys: MutableMapping[ContinentName, List[int]] = self._debug_avatars_ys[aid]
             last_loc = None
-            for last_loc in self._avatars[aid].debug_path[-SECONDS_IN_VTIME:]:
+            for last_loc, _, seconds in self._avatars[aid].debug_path[-1]:
                 if last_loc is not None:
                     x, y = last_loc.get_coords()
-                    xs[last_loc.get_continent().get_name()].append(x)
-                    ys[last_loc.get_continent().get_name()].append(y)
+                    xs[last_loc.get_continent().get_name()].extend([x] * seconds)
+                    ys[last_loc.get_continent().get_name()].extend([y] * seconds)
 
             for ax, cont_type in conts:
                 with open(os.path.join('Maps', f"{cont_type.value}.pickle"), 'rb') as pickle_f:
@@ -318,16 +677,46 @@ class Scene:
             animator.save(os.path.join(self._output_folder, f'Scene{self._scene_num}',
                                        f'avatars-{"_".join(aid for aid in sorted(self._debug_avatar_ids))}.gif'), writer=writer)
 
-    # record the current state (avatars, locations and guilds) for the testing data.
+    # record the current state (the locations of the avatars, and their guilds when the window is over) for the
+    #  testing data.
     def _update_debug_data(self):
-        for a in self._avatars.values():
-            time = self._clock
-            aid = a.get_id()
-            lid = a.get_location().get_id() if a.get_location() else None
-            gid = a.get_guild().get_id() if a.get_guild() else None
-
-            self._test_avatar_dict[(time, a.get_device_name())] = (lid, gid)
-            if lid:
-                self._test_loc_dict[(time, lid)].add(aid)
-            if gid:
-                self._test_guild_dict[(time, gid)].add(aid)
+        second = self._clock % SECONDS_IN_VTIME
+        if second == 0:
+            seconds = min(SECONDS_IN_VTIME, self._actual_minutes_len * MINUTE - self._clock)
+            self._test_locations = np.full((seconds, len(self._avatars)), NO_ITEM, dtype=np.int32)
+            self._test_loc_codes = {}
+        indices, codes = [], []
+        for a in self._active_avatars:
+            loc = a.get_location()
+            if loc:
+                indices.append(a.index)
+                codes.append(self._test_loc_codes.setdefault(loc, len(self._test_loc_codes)))
+        self._test_locations[second, indices] = codes
+
+        if second == len(self._test_locations) - 1:
+            start = self._clock - second
+            guild_codes: MutableMapping[Guild, int] = {}
+            guilds = [NO_ITEM if a.get_guild() is None else guild_codes.setdefault(a.get_guild(), len(guild_codes))
+                      for a in self._avatars.values()]
+            save_test_window(os.path.join(self._test_dir, test_window_file_name(self._scene_num, start // MINUTE)), start,
+                             self._test_locations, np.array(guilds, dtype=np.int32),
+                             [loc.id for loc in self._test_loc_codes], [g.id for g in guild_codes])
+
+
+# the scene of a process of Scene._run_windows_pool().
+_window_scene: Optional[Scene] = None
+
+
+def _init_window_worker(scene_args: Tuple[int, str, int, int, Optional[IoMultiplier]]) -> None:
+    global _window_scene
+    scene_num, output_folder, seed, minutes_len, multiplier = scene_args
+    _window_scene = Scene(scene_num, output_folder, seed=seed, scene_minutes_limit=minutes_len, show_progress=False)
+    _window_scene._multiplier = multiplier
+
+
+# run an independent window ((start_time, end_time, path), compress, num_compressors) and get its (start_time, end_time).
+def _run_window(window_args: Tuple[Tuple[int, int, str], Optional[int], int]) -> Tuple[int, int]:
+    window, compress, num_compressors = window_args
+    _window_scene._num_compressors = num_compressors
+    _window_scene._run_serial([window], compress, False, '', independent_windows=True)
+    return window[0], window[1]
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import os
+from typing import MutableMapping, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# A binary columnar copy of Scenes/sceneN.csv, so a scene is memory-mapped instead of parsed as text.
+#  Scenes/sceneN.npy       - records of (virtual_time, avatar_id, place, guild), all integer codes (guild 'NO' is -1).
+#  Scenes/sceneN.dict.npz  - the names behind the codes of avatar_id, place and guild.
+# The cache is used only while it's newer than the csv file.
+
+
+SCENE_DTYPE = np.dtype([('virtual_time', '<i4'), ('avatar_id', '<i4'), ('place', '<i4'), ('guild', '<i4')])
+CSV_DTYPES = {'virtual_time': int, 'avatar_id': str, 'place': str, 'guild': str}
+
+
+def scene_csv_path(scene_num: int) -> str:
+    return os.path.join('Scenes', f'scene{scene_num}.csv')
+
+
+def scene_cache_paths(scene_num: int) -> Tuple[str, str]:
+    return os.path.join('Scenes', f'scene{scene_num}.npy'), os.path.join('Scenes', f'scene{scene_num}.dict.npz')
+
+
+# is there a cache for this scene that's up-to-date with its csv file.
+def is_cache_valid(scene_num: int) -> bool:
+    csv_mtime = os.path.getmtime(scene_csv_path(scene_num))
+    return all(os.path.isfile(p) and os.path.getmtime(p) >= csv_mtime for p in scene_cache_paths(scene_num))
+
+
+# encode the scene's DataFrame (virtual_time, avatar_id, guild, place) and save it as the scene's cache.
+def write_scene_cache(scene_num: int, scene_df: pd.DataFrame) -> Tuple[np.ndarray, MutableMapping[str, np.ndarray]]:
+    records = np.empty(len(scene_df), dtype=SCENE_DTYPE)
+    names: MutableMapping[str, np.ndarray] = {}
+    records['virtual_time'] = scene_df['virtual_time'].to_numpy()
+    for field in ('avatar_id', 'place'):
+        codes, uniques = pd.factorize(scene_df[field].astype(str))
+        records[field] = codes
+        names[field] = np.array(uniques, dtype=str)
+    guilds = scene_df['guild'].astype(str)
+    codes, uniques = pd.factorize(guilds.where(guilds != 'NO'))     # 'NO' -> -1
+    records['guild'] = codes
+    names['guild'] = np.array(uniques, dtype=str)
+    save_scene_cache(scene_num, records, names)
+    return records, names
+
+
+# save the scene's encoded records (SCENE_DTYPE, may be memory-mapped) and names as its cache.
+# files are written to a temporary name and then renamed, so a concurrent reader never sees a partial cache.
+def save_scene_cache(scene_num: int, records: np.ndarray, names: MutableMapping[str, np.ndarray]) -> None:
+    records_path, names_path = scene_cache_paths(scene_num)
+    with open(f'{records_path}.tmp', 'wb') as f:
+        np.save(f, records)
+    with open(f'{names_path}.tmp', 'wb') as f:
+        np.savez(f, **names)
+    os.replace(f'{names_path}.tmp', names_path)
+    os.replace(f'{records_path}.tmp', records_path)
+
+
+# read the scene as (records, names) - from the cache if it's up-to-date (memory-mapped, read-only),
+#  otherwise from the csv file (and create the cache for the next time).
+def load_scene(scene_num: int) -> Tuple[np.ndarray, MutableMapping[str, np.ndarray]]:
+    if is_cache_valid(scene_num):
+        records_path, names_path = scene_cache_paths(scene_num)
+        with np.load(names_path) as names_f:
+            names = {field: names_f[field] for field in names_f.files}
+        return np.load(records_path, mmap_mode='r'), names
+    scene_df = pd.read_csv(scene_csv_path(scene_num), header=0, dtype=CSV_DTYPES)
+    return write_scene_cache(scene_num, scene_df)
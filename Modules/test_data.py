@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from typing import List, MutableMapping
+
+import numpy as np
+
+
+# The test data of a scene run (run -t), checked against the window files by "test" (Scripts/debug_test.py):
+#  test_data_scene{n}.npz            - the ids and device names of the scene's avatars (by their index).
+#  test_data_scene{n}_{minute}.npz   - a window, by the minute it starts at:
+#   start      - the clock of the window's first second.
+#   locations  - the location of every avatar at every second of the window (seconds x avatars), NO_ITEM
+#                (Modules/checkpoint.py) if offline.
+#   guilds     - the guild of every avatar (guilds change only when a vtime starts, so one row is enough for a window).
+#   loc_ids, guild_ids - the ids of the location and guild codes (codes of the window only).
+
+
+def test_names_file_name(scene_num: int) -> str:
+    return f'test_data_scene{scene_num}.npz'
+
+
+def test_window_file_name(scene_num: int, start_minute: int) -> str:
+    return f'test_data_scene{scene_num}_{start_minute}.npz'
+
+
+def save_test_names(path: str, avatar_ids: List[str], device_names: List[str]) -> None:
+    np.savez(path, avatars=np.array(avatar_ids), devices=np.array(device_names))
+
+
+def save_test_window(path: str, start: int, locations: np.ndarray, guilds: np.ndarray, loc_ids: List[str],
+                     guild_ids: List[str]) -> None:
+    np.savez_compressed(path, start=np.array(start), locations=locations, guilds=guilds, loc_ids=np.array(loc_ids, dtype=str),
+                        guild_ids=np.array(guild_ids, dtype=str))
+
+
+def load_test_data(path: str) -> MutableMapping[str, np.ndarray]:
+    with np.load(path) as f:
+        return {name: f[name] for name in f.files}
+
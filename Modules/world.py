@@ -1,55 +1,59 @@
 from __future__ import annotations
 
-import os
-import pandas as pd
+from bisect import bisect_right
+import numpy as np
 from typing import MutableMapping, List
 
 from Modules import *
-
-# string to CityType
-cities_types = {'capital': CityType.Capital, 'instance': CityType.Instance, 'major city': CityType.Major,
-                'minor city': CityType.Minor}
+from Modules.world_cache import get_world_maps
 
 
 class World:
-    # initialize all continents (and the zones, and locations inside them), cities, and the zones-graph.
+    # initialize all continents (and the zones inside them), cities, and the zones-graph - from the compiled maps of
+    #  the process (see Modules/world_cache.py). the world itself holds only the objects, and the avatars in them.
     def __init__(self):
         self._continents: MutableMapping[ContinentName, Continent] = {}
         self._zones: MutableMapping[str, Zone] = {}
         self._cities: List[City] = []
         self._named_cities: MutableMapping[str, City] = {}
+        # the first location code of each continent (see get_location_code()).
+        self._location_offsets: List[int] = []
+        world = get_world_maps()
 
-        for continent_name in ContinentName:
-            c = Continent(continent_name)
+        offset = 0
+        for i, continent_name in enumerate(ContinentName):
+            c = Continent(continent_name, world[f'zones{i}'], world[f'cities{i}'])
             self._continents[continent_name] = c
-            self._zones.update(c.get_zones())
+            self._location_offsets.append(offset)
+            width, height = c.get_bounds()[1]
+            offset += int(width * height)
+
+        # initialize all zones
+        zones: List[Zone] = []
+        for name, i, (tl_x, tl_y, br_x, br_y) in zip(world['zone_names'].tolist(), world['zone_continents'].tolist(),
+                                                     world['zone_bounds'].tolist()):
+            c = self._continents[list(ContinentName)[i]]
+            z = Zone(name, c, (tl_x, tl_y), (br_x, br_y))
+            c.add_zone(z)
+            self._zones[name] = z
+            zones.append(z)
 
         # initialize all cities
-        cities_df = pd.read_csv(os.path.join("Maps", f"cities.csv"), index_col='name', header=0)
-        cities_df.dropna(inplace=True)
-        int_fields = ['tl_x', 'tl_y']
-        cities_df[int_fields] = cities_df[int_fields].astype(int)
-        for _, city in cities_df.iterrows():
-            zone = self._zones[city.zone]
-            city_name = str(city.name)
-            c = City(city_name, cities_types[city.type], (city.tl_x, city.tl_y), zone)
+        for city_name, city_type, z, tl in zip(world['city_names'].tolist(), world['city_types'].tolist(),
+                                               world['city_zones'].tolist(), world['city_tls'].tolist()):
+            zone = zones[z]
+            c = City(city_name, CityType[city_type], tuple(tl), zone)
             self._cities.append(c)
             if city_name != 'NO NAME':
                 self._named_cities[city_name] = c
             zone.add_city(c)
-            for loc in c.get_locations():
-                loc.set_city(c)
+            zone.get_continent().add_city(c)
 
         # create neighbors graph
-        with open(os.path.join('Maps', 'neighbors.txt'), 'r') as f:
-            for line in f:
-                if line.strip() != '' and line.strip()[0] != '#':
-                    z = line.split(':')[0]
-                    neighbors = line.split(':')[1]
-                    for n in neighbors.split(','):
-                        if n.strip():
-                            self.get_zone(z.strip()).add_neighbor(self.get_zone(n.strip()))
-        self._enforce_neighbors_bidirectionally()
+        neighbors = np.unpackbits(world['neighbors'], axis=1, count=len(zones)).astype(bool)
+        for z, row in zip(zones, neighbors):
+            for n in np.flatnonzero(row).tolist():
+                z.add_neighbor(zones[n])
 
     def reset(self) -> None:
         for cont in self._continents.values():
@@ -76,6 +80,16 @@ class World:
     def get_location(self, continent: Continent, x: int, y: int) -> Location:
         return self._continents[continent.get_name()].get_location(x, y)
 
+    # a unique integer of every location (continent after continent, row by row), to save locations compactly.
+    def get_location_code(self, loc: Location) -> int:
+        return self._location_offsets[list(ContinentName).index(loc.get_continent().get_name())] + loc.index
+
+    def get_location_by_code(self, code: int) -> Location:
+        i = bisect_right(self._location_offsets, code) - 1
+        cont = self._continents[list(ContinentName)[i]]
+        y, x = divmod(code - self._location_offsets[i], cont.get_bounds()[1][0])
+        return cont.get_location(x, y)
+
     def is_city(self, city: str) -> bool:
         return city in self._named_cities
 
@@ -90,9 +104,3 @@ class World:
 
     def are_neighbors(self, z1: Zone, z2: Zone) -> bool:
         return z1.is_neighbor(z2)
-
-    def _enforce_neighbors_bidirectionally(self):
-        for z1 in self._zones.values():
-            for z2 in z1.get_neighbors():
-                assert z2.is_neighbor(z1), f'{z1} is not a neighbor of {z2}, but the opposite is true'
-
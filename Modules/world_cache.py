@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import List, MutableMapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from Modules.city import CityType
+from Modules.continent import ContinentName
+
+
+# A compiled copy of the world's maps, so a World is built from a few arrays instead of reading and parsing the maps
+#  (and without a Location for every cell - see Continent.get_location()).
+#  Maps/world.npz:
+#   key             - the hash of the inputs it was compiled from (the maps, and the city sizes in conf.py).
+#   zone_names, zone_continents, zone_bounds - every zone (continent after continent, in the order of the continent's
+#                     csv): its name, its continent (index in ContinentName), and (tl_x, tl_y, br_x, br_y).
+#   city_names, city_types, city_zones, city_tls - every city (in the order of cities.csv): its name, its CityType
+#                     name, its zone (index) and (tl_x, tl_y).
+#   neighbors       - the zones' adjacency matrix (a zone is its own neighbor), as a bitmap (rows packed by np.packbits).
+#   zones{i}, cities{i} - the zone/city of every location (y, x) of the i-th continent, by their index in it (-1 for none).
+# The cache is compiled again whenever its key doesn't match the inputs (when a process loads it - see get_world_maps()).
+
+
+WORLD_CACHE = os.path.join('Maps', 'world.npz')
+KEY_VERSION = 1
+
+# string to CityType
+cities_types = {'capital': CityType.Capital, 'instance': CityType.Instance, 'major city': CityType.Major,
+                'minor city': CityType.Minor}
+
+
+def maps_paths() -> List[str]:
+    return [os.path.join('Maps', f'{c.value}.csv') for c in ContinentName] + \
+           [os.path.join('Maps', 'cities.csv'), os.path.join('Maps', 'neighbors.txt')]
+
+
+# the hash of the inputs of the world.
+def maps_key() -> str:
+    key = hashlib.md5(repr((KEY_VERSION, [t.value for t in CityType])).encode())
+    for path in maps_paths():
+        with open(path, 'rb') as f:
+            key.update(path.encode())
+            key.update(f.read())
+    return key.hexdigest()
+
+
+def compile_world() -> MutableMapping[str, np.ndarray]:
+    world: MutableMapping[str, np.ndarray] = {}
+    zone_names: List[str] = []
+    zone_continents: List[int] = []
+    zone_bounds: List[List[int]] = []
+    for i, continent_name in enumerate(ContinentName):
+        zones_df = pd.read_csv(os.path.join("Maps", f"{continent_name.value}.csv"), index_col='name', header=0)
+        zones_df.dropna(inplace=True)
+        int_fields = ['tl_x', 'tl_y', 'br_x', 'br_y']
+        zones_df[int_fields] = zones_df[int_fields].astype(int)
+        zones = np.full((zones_df['br_y'].max(), zones_df['br_x'].max()), -1, dtype=np.int16)
+        for j, (name, tl_x, tl_y, br_x, br_y) in enumerate(zip(zones_df.index, *(zones_df[f].tolist() for f in int_fields))):
+            zones[tl_y:br_y, tl_x:br_x] = j
+            zone_names.append(str(name))
+            zone_continents.append(i)
+            zone_bounds.append([tl_x, tl_y, br_x, br_y])
+        world[f'zones{i}'] = zones
+        world[f'cities{i}'] = np.full(zones.shape, -1, dtype=np.int16)
+    zone_by_name = {name: z for z, name in enumerate(zone_names)}
+
+    cities_df = pd.read_csv(os.path.join("Maps", "cities.csv"), index_col='name', header=0)
+    cities_df.dropna(inplace=True)
+    int_fields = ['tl_x', 'tl_y']
+    cities_df[int_fields] = cities_df[int_fields].astype(int)
+    city_zones = [zone_by_name[zone] for zone in cities_df['zone']]
+    city_types = [cities_types[city_type] for city_type in cities_df['type']]
+    continent_cities = [0] * len(ContinentName)
+    for z, city_type, tl_x, tl_y in zip(city_zones, city_types, cities_df['tl_x'].tolist(), cities_df['tl_y'].tolist()):
+        # the same bounds as City().
+        _, _, zone_br_x, zone_br_y = zone_bounds[z]
+        br_x, br_y = min(zone_br_x, tl_x + city_type.value[0]), min(zone_br_y, tl_y + city_type.value[1])
+        i = zone_continents[z]
+        world[f'cities{i}'][tl_y:br_y, tl_x:br_x] = continent_cities[i]
+        continent_cities[i] += 1
+
+    neighbors = np.eye(len(zone_names), dtype=bool)
+    with open(os.path.join('Maps', 'neighbors.txt'), 'r') as f:
+        for line in f:
+            if line.strip() != '' and line.strip()[0] != '#':
+                z = line.split(':')[0]
+                for n in line.split(':')[1].split(','):
+                    if n.strip():
+                        neighbors[zone_by_name[z.strip()], zone_by_name[n.strip()]] = True
+    one_sided = np.argwhere(neighbors & ~neighbors.T)
+    assert not len(one_sided), f'{zone_names[one_sided[0][0]]} is not a neighbor of {zone_names[one_sided[0][1]]}, but the opposite is true'
+
+    world.update(zone_names=np.array(zone_names, dtype=str), zone_continents=np.array(zone_continents, dtype=np.int8),
+                 zone_bounds=np.array(zone_bounds, dtype=np.int32).reshape(-1, 4),
+                 city_names=np.array([str(name) for name in cities_df.index], dtype=str),
+                 city_types=np.array([city_type.name for city_type in city_types], dtype=str),
+                 city_zones=np.array(city_zones, dtype=np.int32),
+                 city_tls=cities_df[int_fields].to_numpy(dtype=np.int32).reshape(-1, 2),
+                 neighbors=np.packbits(neighbors, axis=1))
+    return world
+
+
+# the compiled world of this process - loaded once (see load_world()) and shared by all its worlds. its arrays are
+#  read-only, so processes forked after it's loaded share them (copy-on-write) instead of loading their own.
+_world_maps: Optional[MutableMapping[str, np.ndarray]] = None
+
+
+def get_world_maps() -> MutableMapping[str, np.ndarray]:
+    global _world_maps
+    if _world_maps is None:
+        _world_maps = load_world()
+        for array in _world_maps.values():
+            array.setflags(write=False)
+    return _world_maps
+
+
+# the compiled world - from the cache if it's up-to-date, otherwise compiled from the maps (and cached).
+# the cache is written to a temporary name (of the process) and then renamed, so processes that compile it at the same
+#  time never see a partial one.
+def load_world() -> MutableMapping[str, np.ndarray]:
+    key = maps_key()
+    if os.path.isfile(WORLD_CACHE):
+        with np.load(WORLD_CACHE) as f:
+            if str(f['key']) == key:
+                return {name: f[name] for name in f.files}
+    world = compile_world()
+    world['key'] = np.array(key)
+    with open(f'{WORLD_CACHE}.{os.getpid()}.tmp', 'wb') as f:
+        np.savez(f, **world)
+    os.replace(f'{WORLD_CACHE}.{os.getpid()}.tmp', WORLD_CACHE)
+    return world
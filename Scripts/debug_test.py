@@ -1,12 +1,19 @@
-import gzip
 import os
-import pickle
-from typing import Iterator, Tuple, List, MutableMapping, Set
+from typing import Iterator, Tuple, MutableMapping
+import multiprocessing as mp
 
+import numpy as np
+import pandas as pd
 from tqdm import tqdm
 
 
 from Modules import World, ContinentName
+from Modules.checkpoint import NO_ITEM
+from Modules.test_data import test_names_file_name, test_window_file_name, load_test_data
+from Scripts.io_convert import window_files, window_minutes
+
+CHUNK_SIZE = 1 << 20
+UNKNOWN = -2
 
 
 def print_a(a, b):
@@ -95,21 +102,6 @@ def test_world():
     print_a(h.get_random_location() in locs, True)
 
 
-# iterator of all ios (aid, (int)time, obj_id, type) in scene "scene_num".
-def ios(scene_num: int, input_folder: str, pbar: tqdm) -> Iterator[Tuple[str, int, str, str]]:
-    folder: str = os.path.join(input_folder, f'Scene{scene_num}')
-    scene_files: Iterator[str] = (file for file in os.listdir(folder) if file.startswith(f'scene{scene_num}_'))
-    for file in sorted(scene_files, key=lambda x: int(x.split('_')[1].split('-')[0])):
-        is_compressed = file.split('.')[-1] == 'gz'
-        with gzip.open(os.path.join(folder, file), 'rt') if is_compressed else open(os.path.join(folder, file)) as f:
-            for l in f:
-                if l:
-                    # example line: A_0, 0.0, AO_226, 0
-                    line: List[str] = l.split(', ')  # the last element ends with newline
-                    yield line[0], int(line[1].split('.')[0]), line[2], line[3]
-        pbar.update(10)
-
-
 # get number of minutes in the scene.
 def get_scene_length(scene_num: int, input_folder: str) -> int:
     folder: str = os.path.join(input_folder, f'Scene{scene_num}')
@@ -117,38 +109,95 @@ def get_scene_length(scene_num: int, input_folder: str) -> int:
     return max((int(x.split('_')[1].split('-')[1].split('.')[0]) for x in scene_files), default=-1) + 1
 
 
-def test_scene(scene_num: int, input_folder: str) -> None:
+# set once in each tester process by init_tester() - the index of every avatar by its device name and by its id.
+_device_index: MutableMapping[str, int] = {}
+_avatar_index: MutableMapping[str, int] = {}
+
+
+def init_tester(names_path: str) -> None:
+    global _device_index, _avatar_index
+    names = load_test_data(names_path)
+    _device_index = {d: i for i, d in enumerate(names['devices'].tolist())}
+    _avatar_index = {a: i for i, a in enumerate(names['avatars'].tolist())}
+
+
+# check every io of a window file against the window's test data, a chunk of lines at a time (so the memory doesn't
+#  grow with the window) - returns the number of minutes of the window.
+# an avatar reads (or writes) itself and the avatars at its location, its location, and its guild and the guild's
+#  members. the system writes locations and guilds.
+def test_window(scene_folder: str, file: str, test_file: str) -> int:
+    data = load_test_data(os.path.join(scene_folder, test_file))
+    start, locations, guilds = int(data['start']), data['locations'], data['guilds']
+    codes = {'LO_': {name: i for i, name in enumerate(data['loc_ids'].tolist())},
+             'GO_': {name: i for i, name in enumerate(data['guild_ids'].tolist())},
+             'AO_': _avatar_index}
+    line = 0
+    for chunk in pd.read_csv(os.path.join(scene_folder, file), sep=',', skipinitialspace=True, header=None,
+                             names=['device', 'time', 'object', 'op'], dtype=str, keep_default_na=False,
+                             chunksize=CHUNK_SIZE):
+        objects, names = pd.factorize(chunk['object'])
+        kinds = np.array([name[:3] for name in names])
+        # codes of the objects' names (UNKNOWN if it's not a known location, guild or avatar).
+        obj_codes = np.array([codes.get(kind, {}).get(name, UNKNOWN) for kind, name in zip(kinds, names)], dtype=np.int64)
+        kinds, obj_codes = kinds[objects], obj_codes[objects]
+
+        ok = np.zeros(len(chunk), dtype=bool)
+        is_sys = (chunk['device'] == 'sys').to_numpy()
+        ok[is_sys] = ((kinds[is_sys] == 'LO_') | (kinds[is_sys] == 'GO_')) & (obj_codes[is_sys] != UNKNOWN)
+
+        rows = np.flatnonzero(~is_sys)
+        avatars = chunk['device'].iloc[rows].map(_device_index).fillna(UNKNOWN).to_numpy(dtype=np.int64)
+        seconds = chunk['time'].iloc[rows].to_numpy(dtype=np.float64).astype(np.int64) - start
+        valid = (avatars != UNKNOWN) & (seconds >= 0) & (seconds < len(locations))
+        rows, avatars, seconds = rows[valid], avatars[valid], seconds[valid]
+        loc = locations[seconds, avatars]
+        guild = guilds[avatars]
+        kind, obj = kinds[rows], obj_codes[rows]
+        is_loc, is_guild, is_avatar = kind == 'LO_', kind == 'GO_', (kind == 'AO_') & (obj != UNKNOWN)
+        ok[rows[is_loc]] = obj[is_loc] == loc[is_loc]
+        ok[rows[is_guild]] = obj[is_guild] == guild[is_guild]
+        others = obj[is_avatar]
+        same_loc = locations[seconds[is_avatar], others] == loc[is_avatar]
+        same_guild = (guild[is_avatar] != NO_ITEM) & (guilds[others] == guild[is_avatar])
+        ok[rows[is_avatar]] = same_loc | same_guild
+        # an offline avatar has no ios.
+        ok[rows[loc == NO_ITEM]] = False
+
+        bad = np.flatnonzero(~ok)
+        assert not len(bad), f'{file}, line {line + bad[0] + 1}: {", ".join(chunk.iloc[bad[0]])} should not have been generated ' \
+                             f'({len(bad)} bad ios in the chunk)'
+        line += len(chunk)
+    first, last = window_minutes(file)
+    return last - first + 1
+
+
+def _test_window(args: Tuple[str, str, str]) -> int:
+    return test_window(*args)
+
+
+def test_scene(scene_num: int, input_folder: str, num_procs: int = 1) -> None:
     """
     test that every io generated by the input scene should have been generated.
-    requires a test_data_scene{scene_num}.pickle file in the same folder, generated by run -t.
+    requires the test data files (test_data_scene{scene_num}*.npz) in the same folder, generated by run -t.
     :param scene_num: scene number
     :param input_folder: the scenes folder
+    :param num_procs: number of processes to test the windows in parallel.
     """
-    print('Reading debug test data...', end='')
-    with open(os.path.join(input_folder, f'Scene{scene_num}', f"test_data_scene{scene_num}.pickle"), 'rb') as pickle_f:
-        dicts: Tuple[
-            MutableMapping[Tuple[int, str], Tuple[str, str]],
-            MutableMapping[Tuple[int, str], Set[str]],
-            MutableMapping[Tuple[int, str], Set[str]]
-        ] = pickle.load(pickle_f)
-        avatars, locs, guilds = dicts
-    print(' - DONE!')
-    # avatar_dict: (time, avatar) -> (loc, guild)
-    # loc_dict: (time, loc) -> {ao1, ao2, ao3}
-    # guild_dict: (time, guild) -> {ao1, ao2, ao3}
+    scene_folder = os.path.join(input_folder, f'Scene{scene_num}')
+    names_path = os.path.join(scene_folder, test_names_file_name(scene_num))
+    tasks = []
+    for file in window_files(scene_num, scene_folder, 'txt'):
+        test_file = test_window_file_name(scene_num, window_minutes(file)[0])
+        assert os.path.isfile(os.path.join(scene_folder, test_file)), f'{file}: no test data ({test_file})'
+        tasks.append((scene_folder, file, test_file))
 
     with tqdm(total=get_scene_length(scene_num, input_folder)) as pbar:
-        for aid, time, obj, io_tid in ios(scene_num, input_folder, pbar):
-            loc, guild = avatars[(time, aid)]
-            assert loc
-            if obj[0] == 'L':
-                assert loc == obj
-            elif obj[0] == 'G':
-                assert guild == obj
-            elif obj[0] == 'A':
-                same_loc = obj in locs[(time, loc)]
-                same_guild = guild is not None and obj in guilds[(time, guild)]
-                assert same_loc or same_guild
-            else:
-                assert False
+        if num_procs == 1:
+            init_tester(names_path)
+            for task in tasks:
+                pbar.update(test_window(*task))
+        else:
+            with mp.Pool(processes=num_procs, initializer=init_tester, initargs=(names_path,)) as pool:
+                for minutes in pool.imap(_test_window, tasks):
+                    pbar.update(minutes)
     print(f'Test for scene {scene_num} - PASSED')
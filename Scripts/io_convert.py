@@ -0,0 +1,125 @@
+import gzip
+import os
+from time import time
+from typing import List, Iterator, Optional, Tuple
+import multiprocessing as mp
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from Modules import World, ContinentName
+from Modules.io_format import IoNames, IO_DTYPE, OPS, WRITE, names_file_name, read_records
+
+# continent of a location object by the letter in its name (LO_k_156_170 -> Kalimdor).
+continents_by_letter = {c.value[0]: c for c in ContinentName}
+
+
+# all window files (sceneN_t1-t2.{txt,bin}[.gz]) of the scene in folder with this format, ordered by time.
+def window_files(scene_num: int, folder: str, io_format: str) -> List[str]:
+    scene_files: Iterator[str] = (file for file in os.listdir(folder)
+                                  if file.startswith(f'scene{scene_num}_') and file.split('.')[1] == io_format)
+    return sorted(scene_files, key=lambda x: int(x.split('_')[-1].split('-')[0]))
+
+
+# the first and last minutes of a window file (scene{n}_{first}-{last}.txt).
+def window_minutes(file: str) -> Tuple[int, int]:
+    first, last = file.split('_')[-1].split('.')[0].split('-')
+    return int(first), int(last)
+
+
+# the records of a text window file (names are added to "names", locations with their zone and continent).
+def text_to_records(input_file: str, names: IoNames, world: World) -> np.ndarray:
+    if os.path.getsize(input_file) == 0:
+        return np.empty(0, dtype=IO_DTYPE)
+    df = pd.read_csv(input_file, sep=',', skipinitialspace=True, header=None, names=['device', 'time', 'object', 'op'],
+                     dtype={'device': str, 'time': float, 'object': str, 'op': str})
+    records = np.empty(len(df), dtype=IO_DTYPE)
+    records['time'] = df['time'].to_numpy()
+    records['op'] = (df['op'] == OPS[WRITE]).to_numpy()
+    for field in ('device', 'object'):
+        codes, uniques = pd.factorize(df[field])
+        ids = np.empty(len(uniques), dtype=np.int32)
+        for i, name in enumerate(uniques):
+            if name.startswith('LO_'):
+                _, letter, x, y = name.split('_')
+                ids[i] = names.get_location_id(world.get_continent(continents_by_letter[letter]).get_location(int(x), int(y)))
+            else:
+                ids[i] = names.get_id(name)
+        records[field] = ids[codes]
+    return records
+
+
+# the lines of the text format from records ("names" - the name of each id).
+# times are written as the run command writes them (45.0) if they are all whole seconds, otherwise with 6 digits.
+def records_to_text(records: np.ndarray, names: np.ndarray) -> str:
+    if len(records) == 0:
+        return ''
+    times = records['time']
+    time_format = '%.1f' if np.all(np.mod(times, 1) == 0) else '%.6f'
+    ops = np.array(OPS, dtype=object)
+    lines = (names[records['device']] + ', ' + np.char.mod(time_format, times).astype(object) + ', ' +
+             names[records['object']] + ', ' + ops[records['op']] + '\n')
+    return ''.join(lines)
+
+
+def convert_scene(scene_num: int, input_folder: str, output_folder: str, io_format: str, compress: Optional[int], pos: int = 0) -> None:
+    """
+    convert the ios of the scene between the text and binary formats.
+    :param scene_num: scene number
+    :param input_folder: the scenes folder
+    :param output_folder: output-ios folder
+    :param io_format: the format to convert to: 'bin' (from the text files) or 'txt' (from the binary files).
+    :param compress: gzip compression level, None for no compression.
+    :param pos: index of the tqdm line.
+    """
+    i_folder: str = os.path.join(input_folder, f'Scene{scene_num}')
+    o_folder: str = os.path.join(output_folder, f'Scene{scene_num}')
+    if not os.path.isdir(o_folder):
+        os.mkdir(o_folder)
+    from_format = 'txt' if io_format == 'bin' else 'bin'
+    files = window_files(scene_num, i_folder, from_format)
+    ext = io_format if compress is None else f'{io_format}.gz'
+
+    if io_format == 'bin':
+        world = World()
+        names = IoNames()
+    else:
+        names = IoNames.load(os.path.join(i_folder, names_file_name(scene_num))).get_names()
+
+    for file in tqdm(files, position=pos, desc=f'Scene {scene_num}'):
+        output_file = os.path.join(o_folder, f"{file.split('.')[0]}.{ext}")
+        if io_format == 'bin':
+            # noinspection PyUnboundLocalVariable
+            records = text_to_records(os.path.join(i_folder, file), names, world)
+            with open(output_file, 'wb') if compress is None else gzip.open(output_file, 'wb', compresslevel=compress) as f:
+                f.write(records.tobytes())
+            names.save(os.path.join(o_folder, names_file_name(scene_num)))
+        else:
+            text = records_to_text(read_records(os.path.join(i_folder, file)), names)
+            with open(output_file, 'w') if compress is None else gzip.open(output_file, 'wt', compresslevel=compress) as f:
+                f.write(text)
+
+
+def convert_scenes(scene_nums: List[int], input_folder: str, output_folder: str, io_format: str, compress: Optional[int], num_procs: int = 1) -> None:
+    """
+    convert the ios of the scenes between the text and binary formats.
+    :param scene_nums: scene numbers
+    :param input_folder: the scenes folder
+    :param output_folder: output-ios folder
+    :param io_format: the format to convert to: 'bin' (from the text files) or 'txt' (from the binary files).
+    :param compress: gzip compression level, None for no compression.
+    :param num_procs: number of processes to work on these scenes in parallel.
+    """
+    start_time = time()
+    if not os.path.isdir(output_folder):
+        os.mkdir(output_folder)
+    scene_nums = list(dict.fromkeys(scene_nums))
+    if num_procs == 1:
+        for pos, scene_num in enumerate(scene_nums):
+            convert_scene(scene_num, input_folder, output_folder, io_format, compress, pos)
+    else:
+        pool = mp.Pool(processes=min(num_procs, len(scene_nums)))
+        pool.starmap(convert_scene, ((scene_num, input_folder, output_folder, io_format, compress, pos) for pos, scene_num in enumerate(scene_nums)))
+    print('\033[K')
+    print(f'\033[KDone. Total time: {time() - start_time :.2f}s')
@@ -1,24 +1,18 @@
 from __future__ import annotations
 
-import gzip
 import os
-import random
 from time import time
-from typing import Tuple, List, Set, Optional, Iterator
+from typing import Tuple, List, Optional, Iterator
 import multiprocessing as mp
-from tqdm import tqdm
 
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
 
-# iterator of all ios (aid, (int)time, obj_id, type) in file.
-def ios(input_file: str) -> Iterator[Tuple[str, float, str, str]]:
-    is_compressed = input_file.split('.')[-1] == 'gz'
-    with gzip.open(input_file, 'rt') if is_compressed else open(input_file) as f:
-        for l in f:
-            if l:
-                # example line: A_0, 0.0, AO_226, 0\n
-                line: List[str] = l.split(', ')     # the last element ends with newline
-                # assert line[3][-1] == '\n', (line, input_file)
-                yield line[0], float(line[1]), line[2], line[3]
+from Modules.changes import MINUTE
+from Modules.io_multiplier import MICROS, byte_rows, multiply_ios, window_rng
+from Modules.io_writer import IoWriter
+from Scripts.io_convert import window_files, window_minutes
 
 
 # get number of minutes in current scene.
@@ -28,31 +22,57 @@ def get_scene_length(scene_num: int, input_folder: str) -> int:
     return max((int(x.split('_')[1].split('-')[1].split('.')[0]) for x in scene_files), default=-1) + 1
 
 
-# iterator of list[io], all ios per second in file
-def io_per_sec(input_file: str, aids_set: Optional[Set[str]]) -> Iterator[List[Tuple[str, float, str, str]]]:
-    sec_io: List[Tuple[str, float, str, str]] = []
-    curr_sec: Optional[float] = None
-    for io in ios(input_file):
-        if curr_sec is None:
-            curr_sec = io[1]
-        if io[1] > curr_sec:
-            yield sec_io
-            # assert curr_sec + 1 == io[1]
-            sec_io.clear()
-            curr_sec += 1
-        if aids_set is None or io[0] in aids_set:
-            sec_io.append(io)
-    yield sec_io
-
-
-# return the new list[io] created (multiplied by factor, then sorted) from the input ios.
-def multiply_sec(io_sec: List[Tuple[str, float, str, str]], factor: int) -> List[Tuple[str, float, str, str]]:
-    multiplied_sec: List[Tuple[str, float, str, str]] = []
-    for aid, time, obj, io_tid in io_sec:
-        for _ in range(factor):
-            multiplied_sec.append((aid, time+random.random(), obj, io_tid))
-    # assert len(io_sec) * factor == len(multiplied_sec)
-    return sorted(multiplied_sec, key=lambda x: x[1])
+# a text window file as columns - the time of every io (in microseconds), and codes of its device and of the rest of
+#  its line ("obj_id, type\n"), with the byte_rows() of the codes (the device with ", " after it).
+def read_window(input_file: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    try:
+        df = pd.read_csv(input_file, sep=',', skipinitialspace=True, header=None, names=['device', 'time', 'object', 'op'],
+                         dtype={'device': str, 'time': float, 'object': str, 'op': str}, keep_default_na=False)
+    except pd.errors.EmptyDataError:
+        df = pd.DataFrame({'device': [], 'time': [], 'object': [], 'op': []}, dtype=str)
+    times = np.round(df['time'].to_numpy(dtype=np.float64) * MICROS).astype(np.int64)
+    devices, device_names = pd.factorize(df['device'])
+    rests, rest_names = pd.factorize(df['object'] + ', ' + df['op'])
+    return times, devices, byte_rows(f'{name}, ' for name in device_names), rests, \
+        byte_rows(f'{name}\n' for name in rest_names)
+
+
+# multiply the ios of a window file - returns the number of minutes of the window.
+# the random offsets of each window are seeded by (seed, scene, window), so a window's output doesn't depend on which
+#  process made it or on the windows before it.
+def multiply_window(scene_num: int, i_folder: str, o_folder: str, file: str, compress: Optional[int], factor: int,
+                    seed: int, aids: Optional[List[str]]) -> int:
+    first, last = window_minutes(file)
+    rng = window_rng(seed, scene_num, first)
+    ext = 'txt' if compress is None else 'txt.gz'
+    output_file = os.path.join(o_folder, f"multiplied-{factor}-{file.split('.')[0]}.{ext}")
+    times, devices, device_rows, rests, rest_rows = read_window(os.path.join(i_folder, file))
+    indices = np.arange(len(times))
+    if aids:
+        aids_devices = [f'A_{aid}, '.encode() for aid in aids]
+        indices = indices[np.isin(device_rows.view(f'S{device_rows.shape[1]}').ravel(), aids_devices)[devices]]
+    # a minute at a time (the ios are ordered by time).
+    minutes = times[indices] // (MINUTE * MICROS)
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(minutes)) + 1, [len(indices)]))
+    with IoWriter(output_file, True, compress) as f:
+        for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            f.write(multiply_ios(indices[start:end], times, devices, device_rows, rests, rest_rows, factor, rng))
+    return last - first + 1
+
+
+def _multiply_window(args: tuple) -> int:
+    return multiply_window(*args)
+
+
+# the multiply_window() arguments of every window of the scene.
+def window_tasks(scene_num: int, input_folder: str, output_folder: str, compress: Optional[int], factor: int, seed: int,
+                 aids: Optional[List[str]]) -> List[tuple]:
+    i_folder: str = os.path.join(input_folder, f'Scene{scene_num}')
+    o_folder: str = os.path.join(output_folder, f'Scene{scene_num}')
+    if not os.path.isdir(o_folder):
+        os.mkdir(o_folder)
+    return [(scene_num, i_folder, o_folder, file, compress, factor, seed, aids)
+            for file in window_files(scene_num, i_folder, 'txt')]
 
 
 def multiply_scene(scene_num: int, input_folder: str, output_folder: str, compress: int, pos: int = 0, factor: int = 3, seed: int = 0, aids: Optional[List[str]] = None) -> None:
@@ -68,37 +88,22 @@ def multiply_scene(scene_num: int, input_folder: str, output_folder: str, compre
     :param aids: list of avatar ids to be followed (io will be generated for the ios the created).
                  if None - all avatars will be followed.
     """
-    random.seed(seed)
-    i_folder: str = os.path.join(input_folder, f'Scene{scene_num}')
-    o_folder: str = os.path.join(output_folder, f'Scene{scene_num}')
-    if not os.path.isdir(o_folder):
-        os.mkdir(o_folder)
-
-    scene_files: Iterator[str] = (file for file in os.listdir(i_folder) if file.startswith(f'scene{scene_num}_'))
-    sec_num = 0
-    ext = 'txt' if compress is None else 'txt.gz'
     with tqdm(total=get_scene_length(scene_num, input_folder), position=pos, desc=f'Scene {scene_num}') as pbar:
-        for file in sorted(scene_files, key=lambda x: int(x.split('_')[1].split('-')[0])):
-            file_ext = f"{file.split('.')[0]}.{ext}"
-            output_file = os.path.join(o_folder, f'multiplied-{factor}-{file_ext}')
-            with open(output_file, 'w') if compress is None else gzip.open(output_file, 'wt', compresslevel=compress) as f:
-                for io_sec in io_per_sec(os.path.join(i_folder, file), set(f'A_{aid}' for aid in aids) if aids else None):
-                    multiplied_sec = multiply_sec(io_sec, factor)
-                    f.write(''.join(f"{aid}, {time:.6f}, {obj}, {io_tid}" for aid, time, obj, io_tid in multiplied_sec))    # io_tid ends with newline
-                    sec_num += 1
-                    if sec_num % 60 == 0:
-                        pbar.update(1)
+        for task in window_tasks(scene_num, input_folder, output_folder, compress, factor, seed, aids):
+            pbar.update(multiply_window(*task))
 
 
 def multiply_scenes(scene_nums: List[int], input_folder: str, output_folder: str, compress: int, factor: int, seed: int, num_procs: int = 1, aids: Optional[List[str]] = None) -> None:
     """
     multiply "factor" times the ios generated by the input scenes, by "aids" avatars.
+    the windows of all scenes are multiplied in parallel, so even a single scene uses all the processes.
     :param scene_nums: scene numbers
     :param input_folder: the scenes folder
     :param output_folder: output-ios folder
     :param compress: gzip compression level, None for no compression.
     :param factor: multiply factor
     :param seed: random seed
+    :param num_procs: number of processes to work on the windows of these scenes in parallel.
     :param aids: list of avatar ids to be followed (io will be generated for the ios the created).
                  if None - all avatars will be followed.
     """
@@ -110,7 +115,15 @@ def multiply_scenes(scene_nums: List[int], input_folder: str, output_folder: str
         for pos, scene_num in enumerate(scene_nums):
             multiply_scene(scene_num, input_folder, output_folder, compress, pos, factor, seed, aids)
     else:
-        pool = mp.Pool(processes=min(num_procs, len(scene_nums)))
-        pool.starmap(multiply_scene, ((scene_num, input_folder, output_folder, compress, pos, factor, seed, aids) for pos, scene_num in enumerate(scene_nums)))
+        tasks = [task for scene_num in scene_nums
+                 for task in window_tasks(scene_num, input_folder, output_folder, compress, factor, seed, aids)]
+        pbars = {scene_num: tqdm(total=get_scene_length(scene_num, input_folder), position=pos, desc=f'Scene {scene_num}')
+                 for pos, scene_num in enumerate(scene_nums)}
+        with mp.Pool(processes=min(num_procs, max(len(tasks), 1))) as pool:
+            # the windows are reported in order - a scene's bar shows the windows done from its start.
+            for task, minutes in zip(tasks, pool.imap(_multiply_window, tasks)):
+                pbars[task[0]].update(minutes)
+        for pbar in pbars.values():
+            pbar.close()
     print('\033[K')
     print(f'\033[KDone. Total time: {time() - start_time :.2f}s')
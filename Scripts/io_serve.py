@@ -0,0 +1,174 @@
+import gzip
+import os
+import socket
+from time import perf_counter, sleep
+from typing import Iterator, Tuple, Optional, TextIO
+
+import numpy as np
+from tqdm import tqdm
+
+from Modules.io_format import IO_DTYPE, IoNames, read_records
+from Scripts.io_convert import window_files, records_to_text
+from Scripts.scenes_run import iter_scene_ios
+
+# Replay of a scene's ios over a socket, at the pace of their timestamps (or faster).
+# The stream is the content of the window files one after the other - text lines, or binary IO_DTYPE records (see
+#  Modules/io_format.py) - without any framing, and it ends when the connection is closed.
+# Sending blocks while the client doesn't keep up (the socket's buffer is full), so a slow client slows the replay
+#  down instead of losing ios - the seconds sent behind schedule are counted in the report.
+
+CHUNK_SIZE = 1 << 16
+
+
+# the (second, ios, number of ios) of every second of the scene's window files.
+def file_seconds(scene_num: int, input_folder: str, io_format: str) -> Iterator[Tuple[float, bytes, int]]:
+    scene_folder = os.path.join(input_folder, f'Scene{scene_num}')
+    for file in window_files(scene_num, scene_folder, io_format):
+        path = os.path.join(scene_folder, file)
+        if io_format == 'bin':
+            records = read_records(path)
+            times, starts = np.unique(records['time'], return_index=True)
+            ends = np.append(starts[1:], len(records))
+            for t, start, end in zip(times.tolist(), starts.tolist(), ends.tolist()):
+                yield t, records[start:end].tobytes(), end - start
+        else:
+            with open(path, 'r') if not file.endswith('.gz') else gzip.open(path, 'rt') as f:
+                yield from _text_seconds(f)
+
+
+# group the lines of a text window file by their second.
+def _text_seconds(f: TextIO) -> Iterator[Tuple[float, bytes, int]]:
+    lines = []
+    cur_time = None
+    for line in f:
+        t = line.split(', ', 2)[1]
+        if t != cur_time:
+            if lines:
+                yield float(cur_time), ''.join(lines).encode(), len(lines)
+            lines = []
+            cur_time = t
+        lines.append(line)
+    if lines:
+        yield float(cur_time), ''.join(lines).encode(), len(lines)
+
+
+# the (second, ios, number of ios) of every second of a scene generated live (see Scene.iter_ios()).
+def live_seconds(names: IoNames, scene_ios: Iterator[np.ndarray], io_format: str) -> Iterator[Tuple[float, bytes, int]]:
+    for second, records in enumerate(scene_ios):
+        if io_format == 'bin':
+            payload = records.tobytes()
+        else:
+            payload = records_to_text(records, names.get_names()).encode()
+        yield float(second), payload, len(records)
+
+
+# a listening socket - "unix:PATH" for a unix socket, otherwise "HOST:PORT".
+def listen(address: str) -> socket.socket:
+    if address.startswith('unix:'):
+        path = address[len('unix:'):]
+        if os.path.exists(path):
+            os.remove(path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+    else:
+        host, port = address.rsplit(':', 1)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, int(port)))
+    sock.listen(1)
+    return sock
+
+
+def connect(address: str) -> socket.socket:
+    if address.startswith('unix:'):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(address[len('unix:'):])
+    else:
+        host, port = address.rsplit(':', 1)
+        sock = socket.create_connection((host, int(port)))
+    return sock
+
+
+def serve_scene(scene_num: int, address: str, speed: float = 1, input_folder: Optional[str] = 'IOs', io_format: str = 'txt',
+                seed: int = None, minutes_limit: int = None) -> None:
+    """
+    wait for a client on address, and stream the ios of the scene to it at the pace of their timestamps.
+    :param scene_num: scene number
+    :param address: "HOST:PORT" (tcp) or "unix:PATH" (unix socket).
+    :param speed: replay speed - 1 for real time, N for N times faster. 0 - as fast as the client reads.
+    :param input_folder: the folder of the scenes' ios (from "run"). None - generate the ios of the scene live.
+    :param io_format: 'txt' (text lines) or 'bin' (binary records) - the files to read, and the format of the stream.
+    :param seed: random seed of a live scene. None will set the seed to the scene_num.
+    :param minutes_limit: stream a live scene for a limited number of minutes. None will run until scene is over.
+    """
+    if input_folder is None:
+        # the scene is built before waiting for the client, so it's not part of the replay.
+        seconds = live_seconds(*iter_scene_ios(scene_num, seed, minutes_limit), io_format)
+    else:
+        seconds = file_seconds(scene_num, input_folder, io_format)
+
+    server = listen(address)
+    print(f'Scene {scene_num}: waiting for a client on {address}')
+    conn, _ = server.accept()
+    sent_ios = 0
+    late_seconds = 0
+    max_lag = 0.
+    first_time = last_time = None
+    pbar = tqdm(desc=f'Scene {scene_num}', unit='s')
+    with conn:
+        start = perf_counter()
+        for t, payload, count in seconds:
+            if first_time is None:
+                first_time = t
+            last_time = t
+            if speed > 0:
+                lag = perf_counter() - (start + (t - first_time) / speed)
+                if lag < 0:
+                    sleep(-lag)
+                elif lag > 1 / speed:
+                    late_seconds += 1
+                    max_lag = max(max_lag, lag)
+            conn.sendall(payload)
+            sent_ios += count
+            pbar.update()
+        elapsed = perf_counter() - start
+    server.close()
+    if address.startswith('unix:'):
+        os.remove(address[len('unix:'):])
+    pbar.close()
+
+    if first_time is None:
+        print('No ios to send.')
+        return
+    trace_seconds = last_time - first_time + 1
+    print(f'Sent {sent_ios} ios of {trace_seconds:.0f} seconds in {elapsed:.2f}s.')
+    if speed > 0:
+        print(f'Target IOPS: {sent_ios * speed / trace_seconds:.0f}, achieved IOPS: {sent_ios / elapsed:.0f} '
+              f'({late_seconds} seconds sent behind schedule, max lag {max_lag:.2f}s)')
+    else:
+        print(f'Achieved IOPS: {sent_ios / elapsed:.0f}')
+
+
+def receive_ios(address: str, io_format: str = 'txt', output_file: Optional[str] = None) -> None:
+    """
+    a client of "serve" - read the ios stream until it ends, and report how many ios were received and how fast.
+    :param address: "HOST:PORT" (tcp) or "unix:PATH" (unix socket) of the server.
+    :param io_format: format of the stream - 'txt' (text lines) or 'bin' (binary records).
+    :param output_file: save the stream to this file. None won't save it.
+    """
+    received_bytes = 0
+    received_ios = 0
+    with connect(address) as sock, open(output_file, 'wb') if output_file else open(os.devnull, 'wb') as f:
+        start = perf_counter()
+        while True:
+            chunk = sock.recv(CHUNK_SIZE)
+            if not chunk:
+                break
+            received_bytes += len(chunk)
+            if io_format == 'txt':
+                received_ios += chunk.count(b'\n')
+            f.write(chunk)
+        elapsed = perf_counter() - start
+    if io_format == 'bin':
+        received_ios = received_bytes // IO_DTYPE.itemsize
+    print(f'Received {received_ios} ios ({received_bytes} bytes) in {elapsed:.2f}s, {received_ios / max(elapsed, 1e-9):.0f} IOPS')
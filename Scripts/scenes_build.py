@@ -1,11 +1,21 @@
+from __future__ import annotations
+
+import hashlib
 import os
-from typing import Optional, List, MutableMapping, Set, IO
+from collections import deque
+from typing import Optional, List, MutableMapping, Set, IO, Tuple, Iterator, Deque
+import multiprocessing as mp
+from multiprocessing.pool import AsyncResult
 
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 from datetime import datetime, timedelta, date
 from pathlib import Path
 
+from Modules.scene_cache import SCENE_DTYPE, scene_csv_path, save_scene_cache
+from Modules.dataset_cache import PARSED_FOLDER, TIMELINE_FILE, FileRecords, load_timeline, save_timeline, save_day, load_day
+
 # bad values in the db. will be omitted.
 bad_races: Set[str] = {'373族', '547人', '3033', '27410', '74622妖'}
 bad_classes: Set[str] = {'482', '2400', '3485伊'}
@@ -20,22 +30,97 @@ replaces: MutableMapping[str, str] = {"Quel'thalas": "Eversong Woods", "The Blac
 bad_files: Set[str] = {'00-00-00--srvcombine.txt', '20-39-00--dataloss.txt', '10-05-00----從此開始分組改變.txt'}
 
 
+# the parsing rules - a cached day (Modules/dataset_cache.py) parsed with other rules is parsed again.
+PARSER_KEY: str = hashlib.md5(repr((1, sorted(bad_races), sorted(bad_classes), sorted(removes), sorted(replaces.items()),
+                                    sorted(bad_files))).encode()).hexdigest()
+
 THURSDAY_GAP: int = 120
 DAY: int = 1440
 
 init_time: Optional[datetime] = None                # time of first good record in this scene
 prev_time: Optional[datetime] = None                # time of last good record
 last_problematic_thursday: Optional[date] = None    # date of last thursday - so not to count the same thursday twice.
-rows: List[MutableMapping[str, str]] = []           # list of good records - {virtual time, avatar id, guild id, zone}.
+writer: Optional[SceneWriter] = None                # the good records of the current scene.
 scene_num: int = 0          # number of last scene (first scene will be Scene1)
 virtual_time: int = 0       # current virtual time (num. of records in the current scene up to this point).
 total_counter: int = 0      # number of good records in current scene.
 
 
-# process a line (string, record) from the file
-#  if it's a good record - append {virtual time, avatar id, guild id, zone} to "rows"
-def process_line(line: str) -> None:
-    global total_counter
+CHUNK_RECORDS: int = 1 << 16
+COLUMNS: List[str] = ['virtual_time', 'avatar_id', 'guild', 'place']
+
+
+# The records of the current scene, streamed to temporary files in chunks as they arrive (so the memory doesn't grow
+#  with the scene) - the csv lines, and the records of its cache (Modules/scene_cache.py), with codes given to the
+#  names in the order they first appear (like write_scene_cache()).
+# save() renames the files to a scene's files, discard() removes them - either way it starts over for the next scene.
+class SceneWriter:
+    def __init__(self, folder: str):
+        self._csv_path: str = os.path.join(folder, 'current_scene.csv.tmp')
+        self._records_path: str = os.path.join(folder, 'current_scene.records.tmp')
+        self._start()
+
+    def _start(self) -> None:
+        self._csv: IO = open(self._csv_path, 'w', encoding='utf8')
+        pd.DataFrame(columns=COLUMNS).to_csv(self._csv, index=False)
+        self._records: IO = open(self._records_path, 'wb')
+        self._codes: MutableMapping[str, MutableMapping[str, int]] = {'avatar_id': {}, 'place': {}, 'guild': {}}
+        self._chunk: MutableMapping[str, List] = {column: [] for column in COLUMNS}
+
+    def add(self, vtime: int, avatars: List[str], guilds: List[str], places: List[str]) -> None:
+        self._chunk['virtual_time'].extend([vtime] * len(avatars))
+        self._chunk['avatar_id'].extend(avatars)
+        self._chunk['guild'].extend(guilds)
+        self._chunk['place'].extend(places)
+        if len(self._chunk['virtual_time']) >= CHUNK_RECORDS:
+            self._flush()
+
+    def _flush(self) -> None:
+        chunk = self._chunk
+        if not chunk['virtual_time']:
+            return
+        pd.DataFrame(chunk).to_csv(self._csv, header=False, index=False)
+        records = np.empty(len(chunk['virtual_time']), dtype=SCENE_DTYPE)
+        records['virtual_time'] = chunk['virtual_time']
+        for field in ('avatar_id', 'place'):
+            codes = self._codes[field]
+            records[field] = [codes.setdefault(name, len(codes)) for name in chunk[field]]
+        codes = self._codes['guild']
+        records['guild'] = [-1 if name == 'NO' else codes.setdefault(name, len(codes)) for name in chunk['guild']]
+        records.tofile(self._records)
+        self._chunk = {column: [] for column in COLUMNS}
+
+    def _close(self) -> None:
+        self._flush()
+        self._csv.close()
+        self._records.close()
+
+    # save the records as the scene's csv file and cache.
+    def save(self, scene_num: int) -> None:
+        self._close()
+        os.replace(self._csv_path, scene_csv_path(scene_num))
+        names = {field: np.array(list(codes), dtype=str) for field, codes in self._codes.items()}
+        save_scene_cache(scene_num, np.memmap(self._records_path, dtype=SCENE_DTYPE, mode='r')
+                         if os.path.getsize(self._records_path) else np.empty(0, dtype=SCENE_DTYPE), names)
+        os.remove(self._records_path)
+        self._start()
+
+    def discard(self) -> None:
+        self._close()
+        os.remove(self._csv_path)
+        os.remove(self._records_path)
+        self._start()
+
+    # remove the temporary files (at the end of the build).
+    def close(self) -> None:
+        self._close()
+        os.remove(self._csv_path)
+        os.remove(self._records_path)
+
+
+# parse a line (string, record) from the file
+#  if it's a good record - return (avatar id, guild id, zone), otherwise None.
+def parse_line(line: str) -> Optional[Tuple[str, str, str]]:
     row: List[str] = line.split('"')[1].split(',')
     # query_sequence_number: str = row[2].strip()
     avatar_id: str = row[3].strip()
@@ -46,32 +131,48 @@ def process_line(line: str) -> None:
     place: str = row[8].strip()
 
     if race in bad_races:
-        return
+        return None
     if class_ in bad_classes:
-        return
+        return None
     if place in removes:
-        return
+        return None
     if place in replaces:
         place = replaces[place]
     if not guild:
         guild = 'NO'
+    return avatar_id, guild, place
+
+
+# the good records of a file (the records before a bad line are kept, like they were read one by one).
+def parse_file(filename: str) -> FileRecords:
+    avatars: List[str] = []
+    guilds: List[str] = []
+    places: List[str] = []
+    try:
+        with open(filename, 'r', encoding='utf8') as file:
+            data: List[str] = file.read().split('{\n')[1].split('}')[0].replace('\t', '').split('\n')[:-1]
+            for line in data:
+                record = parse_line(line)
+                if record is not None:
+                    avatars.append(record[0])
+                    guilds.append(record[1])
+                    places.append(record[2])
+    except Exception as e:
+        return avatars, guilds, places, str(e)
+    return avatars, guilds, places, None
 
-    d: MutableMapping[str, str] = {
-        'virtual_time': virtual_time,
-        'avatar_id': avatar_id,
-        'guild': guild,
-        'place': place,
-    }
-    rows.append(d)
-    total_counter += 1
+
+# parse the files of a day directory (a task of the pool) - [(file path, its records)], in order.
+def parse_day(day: Tuple[str, List[str]]) -> List[Tuple[str, FileRecords]]:
+    root, files = day
+    return [(os.path.join(root, f), parse_file(os.path.join(root, f))) for f in files if f not in bad_files]
 
 
 # if the gap between the current and the previous file is longer then "max_gap_minutes" minutes - start a new scene.
 #  if the current scene is longer than "min_scene_minute_len" minutes - save it (with a new scene number).
-# we get cur_time from the current file name ("filename")
-def check_end_of_scene(filename: str, summary_file: IO, min_scene_minute_len: int, max_gap_minutes: int) -> None:
-    global init_time, last_problematic_thursday, prev_time, rows, scene_num, virtual_time
-    cur_time: datetime = datetime.strptime(f"{Path(filename).parent.name} {Path(filename).name}", '%Y-%m-%d %H-%M-%S.txt')
+# cur_time - the time of the current file (by its name, from the timeline index).
+def check_end_of_scene(cur_time: datetime, summary_file: IO, min_scene_minute_len: int, max_gap_minutes: int) -> None:
+    global init_time, last_problematic_thursday, prev_time, scene_num, virtual_time
     if init_time is None:
         init_time = cur_time
     if prev_time and (cur_time - prev_time).total_seconds() > 60 * max_gap_minutes:
@@ -83,45 +184,76 @@ def check_end_of_scene(filename: str, summary_file: IO, min_scene_minute_len: in
             if (scene_len.total_seconds() // 60) >= min_scene_minute_len:
                 scene_num += 1
                 print(f'\nScene {scene_num}: {init_time} - {prev_time} ({scene_len})')
-                df = pd.DataFrame(rows)
-                # noinspection PyTypeChecker
-                df.to_csv(os.path.join('Scenes', f'scene{scene_num}.csv'), index=False)
+                writer.save(scene_num)
                 summary_file.write(f'Scene {scene_num}: {init_time} - {prev_time} ({scene_len})\n')
-            rows.clear()
+            else:
+                writer.discard()
             init_time = cur_time
             virtual_time = 0
     prev_time = cur_time
 
 
-# process all the entries from this file. might build some scenes through the process.
+# add the records of this file (parsed by parse_file()) to the scene. might build some scenes through the process.
 # scene is at-least "min_scene_minute_len" minutes, and with no gaps longer then "max_gap_minutes" minutes.
-def process_file(filename: str, summary_file: IO, min_scene_minute_len: int, max_gap_minutes: int) -> None:
-    global virtual_time
-    if Path(filename).name in bad_files:
-        return
-    check_end_of_scene(filename, summary_file, min_scene_minute_len, max_gap_minutes)
-    try:
-        with open(filename, 'r', encoding='utf8') as file:
-            data: List[str] = file.read().split('{\n')[1].split('}')[0].replace('\t', '').split('\n')[:-1]
-            for line in data:
-                process_line(line)
+def process_file(filename: str, cur_time: datetime, records: FileRecords, summary_file: IO, min_scene_minute_len: int,
+                 max_gap_minutes: int) -> None:
+    global virtual_time, total_counter
+    check_end_of_scene(cur_time, summary_file, min_scene_minute_len, max_gap_minutes)
+    avatars, guilds, places, error = records
+    writer.add(virtual_time, avatars, guilds, places)
+    total_counter += len(avatars)
+    if error is None:
         virtual_time += 1
-    except Exception as e:
-        print(f'ERROR: in {filename}, {e}')
+    else:
+        print(f'ERROR: in {filename}, {error}')
+
+
+# the records of a day's files (root, files, is it cached) - from the day's cache if it's up-to-date, otherwise
+#  parsed (and cached).
+def read_day(day: Tuple[str, List[str], bool]) -> List[Tuple[str, FileRecords]]:
+    root, files, cached = day
+    day_name = Path(root).name
+    if cached:
+        day_records = load_day(day_name, PARSER_KEY)
+        if day_records is not None:
+            return [(os.path.join(root, file), records) for file, records in day_records]
+    day_records = parse_day((root, files))
+    save_day(day_name, [(Path(filename).name, records) for filename, records in day_records], PARSER_KEY)
+    return day_records
 
 
-def build_scenes(data_path: str, min_scene_minute_len: int, max_gap_minutes: int) -> None:
+# the read_day() of the days, in order. with num_procs > 1 they're read by a pool, only a few days ahead of the
+#  reader (so the parsed records don't pile up while the scenes are written).
+def parsed_days(days: List[Tuple[str, List[str], bool]], num_procs: int) -> Iterator[List[Tuple[str, FileRecords]]]:
+    if num_procs == 1:
+        yield from map(read_day, days)
+        return
+    with mp.Pool(processes=num_procs) as pool:
+        pending: Deque[AsyncResult] = deque()
+        for day in days:
+            pending.append(pool.apply_async(read_day, (day,)))
+            if len(pending) > 2 * num_procs:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def build_scenes(data_path: str, min_scene_minute_len: int, max_gap_minutes: int, num_procs: int = 1, reparse: bool = False) -> None:
     """
     build scenes (to the ./Scenes folder) from the database, with minimum length and without any gaps.
+    the day directories are parsed by num_procs processes, and their records are added to the scenes in order.
+    the dataset is read from its timeline index, and the parsed days are cached (./Parsed, see Modules/dataset_cache.py) -
+    only days that were added or changed since the last build are listed and parsed.
     :param data_path: the original database.
     :param min_scene_minute_len: minimum non-gaps minute-length to be considered a scene.
     :param max_gap_minutes: max minutes between consecutive data record to not be considered a gap.
+    :param num_procs: number of processes to parse the database in parallel.
+    :param reparse: list and parse all the days, even if they're cached.
     """
-    global init_time, prev_time, last_problematic_thursday, rows, scene_num, virtual_time, total_counter
+    global init_time, prev_time, last_problematic_thursday, writer, scene_num, virtual_time, total_counter
     init_time = None
     prev_time = None
     last_problematic_thursday = None
-    rows = []
     scene_num = 0
     virtual_time = 0
     total_counter = 0
@@ -132,16 +264,39 @@ def build_scenes(data_path: str, min_scene_minute_len: int, max_gap_minutes: int
     else:
         os.mkdir('Scenes')
 
+    writer = SceneWriter('Scenes')
     last_date: datetime = datetime(year=2008, month=11, day=1)
     with open(os.path.join('Scenes', 'scenes_summary.txt'), 'w') as summary_file:
         summary_file.write(f'SCENES SUMMARY (min_len: {min_scene_minute_len} minutes, max_gap: {max_gap_minutes} minutes):\n\n')
-        for root, _, unsorted_files in tqdm(sorted(list(os.walk(data_path, topdown=False)))):
-            for f in sorted(unsorted_files):
-                if datetime.strptime(Path(root).name, '%Y-%m-%d') < last_date:
-                    process_file(os.path.join(root, f), summary_file, min_scene_minute_len, max_gap_minutes)
+        timeline = load_timeline(data_path, reparse, check_files=True)
+        days = [(day, rows) for day, rows in timeline.groupby('day', sort=False)
+                if datetime.strptime(Path(day).name, '%Y-%m-%d') < last_date]
+        # a day is cached if its files were parsed since it was listed (a day whose files changed is listed again, unparsed).
+        tasks = [(os.path.join(data_path, day), rows['name'].tolist(),
+                  not reparse and bool((rows['records'][~rows['name'].isin(bad_files)] >= 0).all())) for day, rows in days]
+        print(f'{sum(not cached for _, _, cached in tasks)} of {len(tasks)} days to parse.')
+        counts = timeline['records'].to_numpy(copy=True)
+        errors = timeline['error'].to_numpy(dtype=object, copy=True)
+        for (day, rows), day_records in tqdm(zip(days, parsed_days(tasks, num_procs)), total=len(days)):
+            files = {name: (i, time) for name, i, time in
+                     zip(rows['name'], rows.index, rows['time'].to_numpy().astype('datetime64[s]').tolist())}
+            for filename, records in day_records:
+                i, cur_time = files[Path(filename).name]
+                if cur_time is None:
+                    raise ValueError(f'{filename} is not named by its time')
+                process_file(filename, cur_time, records, summary_file, min_scene_minute_len, max_gap_minutes)
+                counts[i], errors[i] = len(records[0]), records[3] or ''
         if prev_time:
             # noinspection PyTypeChecker
-            end_time: datetime = prev_time + timedelta(minutes=max_gap_minutes + 100)
-            check_end_of_scene(os.path.join(end_time.strftime("%Y-%m-%d"), end_time.strftime("%H-%M-%S.txt")), summary_file, min_scene_minute_len, max_gap_minutes)
+            check_end_of_scene(prev_time + timedelta(minutes=max_gap_minutes + 100), summary_file, min_scene_minute_len, max_gap_minutes)
+    writer.close()
+
+    timeline['records'], timeline['error'] = counts, errors
+    save_timeline(data_path, timeline)
+    # the cached days that are no longer in the dataset.
+    day_names = {f'{Path(day).name}.npz' for day in timeline['day'].unique()}
+    for file in os.listdir(PARSED_FOLDER):
+        if file.endswith('.npz') and file != TIMELINE_FILE and file not in day_names:
+            os.remove(os.path.join(PARSED_FOLDER, file))
 
     print(f'There is a total of {total_counter} lines.')
@@ -1,12 +1,30 @@
+import gc
 import os
 from time import time
-from typing import List, Optional
+from typing import List, Optional, Tuple, Iterator
 import multiprocessing as mp
 
+import numpy as np
+
 from Modules import *
+from Modules.io_format import IoNames
+from Modules.world_cache import get_world_maps
+
+# the world of this process, reused by the scenes it runs (see get_world()).
+_world: Optional[World] = None
+
 
+# the world for a scene of this process - built once, and reused by the next scenes (a scene resets the avatars in it
+#  when it starts, and keeps only them there). it's built from the compiled maps of the process, which the pool's
+#  workers share with run_scenes() (loaded before they're forked).
+def get_world() -> World:
+    global _world
+    if _world is None:
+        _world = World()
+    return _world
 
-def run_scene(scene_num: int, output_folder: str, keep_output: bool, compress: int, pos: int = 0, seed: int = None, minutes_limit: int = None, debug_test: bool = False, debug_avatar_ids: Optional[List[str]] = None) -> None:
+
+def run_scene(scene_num: int, output_folder: str, keep_output: bool, compress: int, pos: int = 0, seed: int = None, minutes_limit: int = None, debug_test: bool = False, debug_avatar_ids: Optional[List[str]] = None, io_format: str = 'txt', num_formatters: int = 0, resume: bool = False, independent_windows: bool = False, num_compressors: int = 1, factor: int = 1, multiply_avatars: Optional[List[str]] = None) -> None:
     """
     build and run the scene, and generate ios.
     :param scene_num: scene num
@@ -15,37 +33,81 @@ def run_scene(scene_num: int, output_folder: str, keep_output: bool, compress: i
     :param pos: index of the tqdm line.
     :param seed: random seed for the scene. None will set the seed to the scene_num for each scene.
     :param minutes_limit: run (create ios) for a limited number of minutes. None will run until scene is over.
-    :param debug_test: if True: saves the avatar,loc,guild test-dicts to a pickle. (to be used with "test").
+    :param debug_test: if True: saves the avatars' locations and guilds of every window to npz files next to the ios
+     (see Modules/test_data.py, to be used with "test").
     :param debug_avatar_ids: create a path-follow gif for these avatars throughout the run. None won't create a gif.
+    :param io_format: output format - 'txt' (text lines) or 'bin' (binary records, see Modules/io_format.py).
+    :param num_formatters: number of processes to render and write the text ios while the scene is simulated. 0 - no formatters.
+    :param resume: continue from the scene's last checkpoint in output_folder (if there's one of a run with the same options).
+    :param independent_windows: seed every window on its own (see Scene.run()). num_formatters is then the number of
+     processes that run the windows (text only).
+    :param num_compressors: number of threads that compress the output (with compress).
+    :param factor: multiply each io by this factor as it's generated (text only), and write only the multiplied ios
+     (like "multiply" with the scene's seed). 1 - no multiplication.
+    :param multiply_avatars: multiply (and write) only the ios of these avatars. None - all the ios.
     """
-    w = World()
+    w = get_world()
     scene = Scene(scene_num, output_folder, pos, w, debug_test=debug_test, seed=seed, scene_minutes_limit=minutes_limit if minutes_limit is not None else None,
                   debug_avatar_ids=set(debug_avatar_ids) if debug_avatar_ids is not None else None)
-    scene.run(keep_output, compress)
+    scene.run(keep_output, compress, io_format, num_formatters, resume, independent_windows, num_compressors, factor,
+              multiply_avatars)
+
+
+def iter_scene_ios(scene_num: int, seed: int = None, minutes_limit: int = None, independent_windows: bool = False) -> Tuple[IoNames, Iterator[np.ndarray]]:
+    """
+    build the scene, and stream its ios in-process (without writing or formatting them).
+    the ios are the same as "run_scene" generates with these options.
+    :param scene_num: scene num
+    :param seed: random seed for the scene. None will set the seed to the scene_num.
+    :param minutes_limit: generate ios for a limited number of minutes. None will run until scene is over.
+    :param independent_windows: seed every window on its own (see Scene.run()).
+    :return: the names of the ids (filled as the ios are generated), and an iterator of the ios of every second
+     (arrays of Modules.io_format.IO_DTYPE records).
+    """
+    scene = Scene(scene_num, '', world=World(), seed=seed, scene_minutes_limit=minutes_limit, show_progress=False)
+    return scene.get_io_names(), scene.iter_ios(independent_windows)
 
 
-def run_scenes(scene_nums: List[int], output_folder: str, keep_output: bool, compress: int, num_procs: int = 1, seed: int = None, minutes_limit: int = None, debug_test: bool = False, debug_avatar_ids: Optional[List[str]] = None) -> None:
+def run_scenes(scene_nums: List[int], output_folder: str, keep_output: bool, compress: int, num_procs: int = 1, seed: int = None, minutes_limit: int = None, debug_test: bool = False, debug_avatar_ids: Optional[List[str]] = None, io_format: str = 'txt', resume: bool = False, independent_windows: bool = False, num_compressors: int = 1, factor: int = 1, multiply_avatars: Optional[List[str]] = None) -> None:
     """
     build and run the scenes, and generate ios.
-    if num_procs > 1: multiple processes will work on the scenes in parallel.
+    if num_procs > 1: multiple processes will work on the scenes in parallel
+     (a single scene is simulated by one process, and its ios are rendered and written by the others,
+     or with independent_windows - its windows are run by all of them).
     :param scene_nums: list of scene nums.
     :param output_folder: folder for the outputted ios.
     :param compress: gzip compression level, None for no compression.
     :param num_procs: number of processes to work on these scenes in parallel.
     :param seed: random seed for all scenes. None will set the seed to the scene_num for each scene.
     :param minutes_limit: run (create ios) each scene for a limited number of minutes. None will run until the scenes are over.
-    :param debug_test: if True: saves the avatar,loc,guild test-dicts to a pickle. (to be used with "test").
+    :param debug_test: if True: saves the avatars' locations and guilds of every window to npz files next to the ios
+     (see Modules/test_data.py, to be used with "test").
     :param debug_avatar_ids: create path-follow gifs for these avatars throughout the runs. None won't create a gif.
+    :param io_format: output format - 'txt' (text lines) or 'bin' (binary records, see Modules/io_format.py).
+    :param resume: continue each scene from its last checkpoint in output_folder (if there's one of a run with the same options).
+    :param independent_windows: seed every window of a scene on its own, so the windows don't depend on each other (see Scene.run()).
+    :param num_compressors: number of threads that compress the output of each scene (with compress).
+    :param factor: multiply each io by this factor as it's generated (text only), and write only the multiplied ios.
+     1 - no multiplication.
+    :param multiply_avatars: multiply (and write) only the ios of these avatars. None - all the ios.
     """
     start_time = time()
     if not os.path.isdir(output_folder):
         os.mkdir(output_folder)
     scene_nums = list(dict.fromkeys(scene_nums))
-    if num_procs == 1:
+    if num_procs > 1 and len(scene_nums) == 1:
+        run_scene(scene_nums[0], output_folder, keep_output, compress, 0, seed, minutes_limit, debug_test, debug_avatar_ids, io_format,
+                  num_procs if independent_windows else num_procs - 1, resume, independent_windows, num_compressors, factor,
+                  multiply_avatars)
+    elif num_procs == 1:
         for pos, scene_num in enumerate(scene_nums):
-            run_scene(scene_num, output_folder, keep_output, compress, pos, seed, minutes_limit, debug_test, debug_avatar_ids)
+            run_scene(scene_num, output_folder, keep_output, compress, pos, seed, minutes_limit, debug_test, debug_avatar_ids, io_format, 0, resume, independent_windows, num_compressors, factor, multiply_avatars)
     else:
+        # the workers share the compiled maps (and everything else loaded by now) with this process - frozen, so their
+        #  garbage collections don't scan it (and copy its pages).
+        get_world_maps()
+        gc.freeze()
         pool = mp.Pool(processes=min(num_procs, len(scene_nums)))
-        pool.starmap(run_scene, ((scene_num, output_folder, keep_output, compress, pos, seed, minutes_limit, debug_test, debug_avatar_ids) for pos, scene_num in enumerate(scene_nums)))
+        pool.starmap(run_scene, ((scene_num, output_folder, keep_output, compress, pos, seed, minutes_limit, debug_test, debug_avatar_ids, io_format, 0, resume, independent_windows, num_compressors, factor, multiply_avatars) for pos, scene_num in enumerate(scene_nums)))
     print('\033[K')
     print(f'\033[KDone. Total time: {time() - start_time :.2f}s')
@@ -1,74 +1,74 @@
 from pathlib import Path
-from datetime import datetime, date
-from typing import List, Optional
+from datetime import date
+from typing import List, Tuple
 
-from tqdm import tqdm
+import numpy as np
 import os
 import matplotlib.pyplot as plt
 
+from Modules.dataset_cache import load_timeline
+
 DAY: int = 1440
 
 
 def calc_stats(data_path: str, output_folder: str, show: bool, min_day_records: int, max_gap_minutes: int) -> None:
     """
     outputs statistics about gaps, scene lengths, and scene length graphs (saved as images, and optionally presented to the user).
+    the dataset is read from its timeline index (./Parsed, see Modules/dataset_cache.py), listing again only the days that changed.
     :param data_path: path to the original database.
     :param output_folder: path to the output folder (the graph images will be saved there).
     :param show: present the graph to the user (the graph images will be saved anyway).
     :param min_day_records: a day with fewer records than this variable will be tagged as a bad day.
     :param max_gap_minutes: max minutes between consecutive data record to not be considered a gap.
     """
-    total_avg: List[int] = []
-    other_problem_avg: List[int] = []
-    thursdays_problem_avg: List[int] = []
-    gaps_avg: List[int] = []
-    missing_days: int = 0
-    prev_day: Optional[date] = None
-    prev_time: Optional[datetime] = None
-    init_time: Optional[datetime] = None
-    scene_lens: List[int] = []
-    last_problematic_thursday: Optional[date] = None
-    thursday_counter: int = 0
-
     if not os.path.isdir(output_folder):
         os.mkdir(output_folder)
 
-    for root, _, unsorted_files in tqdm(sorted(list(os.walk(data_path, topdown=False)))):
-        files: List[str] = sorted(list(unsorted_files))
-        if files:
-            day: date = datetime.strptime(Path(root).name, '%Y-%m-%d').date()
-            total_avg.append(len(files))
-            if prev_day and (day - prev_day).days > 1:
-                missing_days += (day - prev_day).days - 1
-                print(f'WARNING: missing {(day - prev_day).days -1} days between {prev_day} - {day}')
-            prev_day = day
-            if len(files) < min_day_records:
-                if day.weekday() != 3:
-                    other_problem_avg.append(len(files))
-                    print(f'WARNING: {day} ({day.strftime("%A")}) has only {len(files)} records ')
-                else:
-                    thursdays_problem_avg.append(len(files))
-
-        for f in files:
-            try:
-                cur_time: datetime = datetime.strptime(f"{Path(root).name} {str(f).rstrip('.txt')}", '%Y-%m-%d %H-%M-%S')
-                if init_time is None:
-                    init_time = cur_time
-                if prev_time and ((cur_time - prev_time).total_seconds() // 60) > max_gap_minutes:
-                    gap: int = int((cur_time - prev_time).total_seconds() // 60)
-                    if cur_time.weekday() == 3 and gap >= 120 and cur_time.date() != last_problematic_thursday:
-                        thursday_counter += 1
-                        last_problematic_thursday = cur_time.date()
-                    else:
-                        gaps_avg.append(gap)
-                        scene_len = prev_time - init_time
-                        scene_lens.append(int(scene_len.total_seconds() // 60))
-                        print(f'Scene: {init_time} - {prev_time}. ({scene_len})')
-                        init_time = cur_time
-                prev_time = cur_time
-            except Exception as e:
-                print(e)
-                pass
+    timeline = load_timeline(data_path)
+    days, day_starts, day_files = np.unique(timeline['day'].to_numpy(dtype=str), return_index=True, return_counts=True)
+    dates = np.array([Path(day).name for day in days], dtype='datetime64[D]')
+    weekdays = (dates.astype(np.int64) + 3) % 7     # 1970-01-01 was a thursday (3)
+    # the messages of the days and the files, printed in the order of the files (a day's before its first file's).
+    messages: List[Tuple[int, int, str]] = []
+
+    day_gaps = np.diff(dates).astype(np.int64)
+    missing = np.flatnonzero(day_gaps > 1)
+    missing_days: int = int((day_gaps[missing] - 1).sum())
+    for i in missing:
+        messages.append((day_starts[i + 1], 0, f'WARNING: missing {day_gaps[i] - 1} days between {dates[i]} - {dates[i + 1]}'))
+    problem_days = day_files < min_day_records
+    other_problems = problem_days & (weekdays != 3)
+    for i in np.flatnonzero(other_problems):
+        day: date = dates[i].tolist()
+        messages.append((day_starts[i], 1, f'WARNING: {day} ({day.strftime("%A")}) has only {day_files[i]} records '))
+    total_avg = day_files
+    other_problem_avg = day_files[other_problems]
+    thursdays_problem_avg = day_files[problem_days & (weekdays == 3)]
+
+    times = timeline['time'].to_numpy().astype('datetime64[s]')
+    timed = np.flatnonzero(~np.isnat(times))
+    for i in np.flatnonzero(np.isnat(times)):
+        messages.append((i, 2, f'WARNING: {timeline["day"].iat[i]}/{timeline["name"].iat[i]} is not named by its time'))
+    seconds = times[timed].astype(np.int64)
+    gap_minutes = np.diff(seconds) // 60
+    # the files after the gaps (by their index in seconds).
+    after_gaps = np.flatnonzero(gap_minutes > max_gap_minutes) + 1
+    # the first long gap of a thursday (the weekly maintenance) isn't the end of a scene.
+    gap_days = seconds[after_gaps] // (24 * 60 * 60)
+    maintenance = np.flatnonzero(((gap_days + 3) % 7 == 3) & (gap_minutes[after_gaps - 1] >= 120))
+    maintenance = maintenance[np.r_[True, gap_days[maintenance][1:] != gap_days[maintenance][:-1]]] \
+        if len(maintenance) else maintenance
+    thursday_counter: int = len(maintenance)
+    scene_ends = np.delete(after_gaps, maintenance)
+    gaps_avg = gap_minutes[scene_ends - 1]
+    scene_starts = np.r_[0, scene_ends[:-1]]
+    scene_lens = (seconds[scene_ends - 1] - seconds[scene_starts]) // 60
+    for start, end in zip(scene_starts.tolist(), (scene_ends - 1).tolist()):
+        init_time, prev_time = times[timed[start]].tolist(), times[timed[end]].tolist()
+        messages.append((timed[end + 1], 2, f'Scene: {init_time} - {prev_time}. ({prev_time - init_time})'))
+
+    for _, _, message in sorted(messages, key=lambda m: m[:2]):
+        print(message)
 
     print()
     print()
@@ -78,15 +78,17 @@ def calc_stats(data_path: str, output_folder: str, show: bool, min_day_records:
     print(f'Total files: {len(total_avg)}')
     print(f'Thursdays with problems: {thursday_counter}, {thursday_counter / len(total_avg) * 100 :.2f}% ')
     print(f'Other Problems: {len(other_problem_avg)}, {len(other_problem_avg) / len(total_avg) * 100 :.2f}%')
-    print(f'Avg files per day: {sum(total_avg) / len(total_avg) :.2f}')
-    print(f'Avg files per problems day: {sum(other_problem_avg) / len(other_problem_avg) :.2f}')
-    print(f'Avg files per problems thursdays: {sum(thursdays_problem_avg) / len(thursdays_problem_avg) :.2f}')
+    print(f'Avg files per day: {total_avg.mean() :.2f}')
+    if len(other_problem_avg) > 0:
+        print(f'Avg files per problems day: {other_problem_avg.mean() :.2f}')
+    if len(thursdays_problem_avg) > 0:
+        print(f'Avg files per problems thursdays: {thursdays_problem_avg.mean() :.2f}')
 
     print()
     print(f'Missing days: {missing_days}')
     print(f'Gaps: {len(gaps_avg)}')
     if len(gaps_avg) > 0:
-        print(f'Avg Gaps: {sum(gaps_avg)/len(gaps_avg) :.2f} minutes')
+        print(f'Avg Gaps: {gaps_avg.mean() :.2f} minutes')
 
     plt.bar(range(len(scene_lens)), scene_lens, width=1)
     plt.ylabel('scene length [minutes]')
@@ -100,14 +102,14 @@ def calc_stats(data_path: str, output_folder: str, show: bool, min_day_records:
         plt.clf()
 
     print()
-    print(f'more than a week:  {len(list(filter(lambda x: x >= DAY*7,  scene_lens))):3}')
-    print(f'more than 6 days:  {len(list(filter(lambda x: x >= DAY*6,  scene_lens))):3}')
-    print(f'more than 5 days:  {len(list(filter(lambda x: x >= DAY*5,  scene_lens))):3}')
-    print(f'more than 4 days:  {len(list(filter(lambda x: x >= DAY*4,  scene_lens))):3}')
-    print(f'more than 3 days:  {len(list(filter(lambda x: x >= DAY*3,  scene_lens))):3}')
-    print(f'more than 2 days:  {len(list(filter(lambda x: x >= DAY*2,  scene_lens))):3}')
-    print(f'more than a day:   {len(list(filter(lambda x: x >= DAY,    scene_lens))):3}')
-    print(f'more than 1/2 day: {len(list(filter(lambda x: x >= DAY//2, scene_lens))):3}')
+    print(f'more than a week:  {np.count_nonzero(scene_lens >= DAY*7):3}')
+    print(f'more than 6 days:  {np.count_nonzero(scene_lens >= DAY*6):3}')
+    print(f'more than 5 days:  {np.count_nonzero(scene_lens >= DAY*5):3}')
+    print(f'more than 4 days:  {np.count_nonzero(scene_lens >= DAY*4):3}')
+    print(f'more than 3 days:  {np.count_nonzero(scene_lens >= DAY*3):3}')
+    print(f'more than 2 days:  {np.count_nonzero(scene_lens >= DAY*2):3}')
+    print(f'more than a day:   {np.count_nonzero(scene_lens >= DAY):3}')
+    print(f'more than 1/2 day: {np.count_nonzero(scene_lens >= DAY//2):3}')
     print(f'total no. scenes:  {len(scene_lens):3}')
 
     plt.hist(scene_lens, color='green', bins=range(0, max(scene_lens), 100))
@@ -122,7 +124,7 @@ def calc_stats(data_path: str, output_folder: str, show: bool, min_day_records:
         plt.clf()
 
     bins: List[int] = list(range(0, max(scene_lens), 100))
-    longer_than: List[int] = [len(list(filter(lambda x: x >= thresh, scene_lens))) for thresh in bins[:-1]]
+    longer_than: np.ndarray = len(scene_lens) - np.searchsorted(np.sort(scene_lens), bins[:-1], 'left')
 
     plt.bar(bins[:-1], longer_than, color='red', width=100)
     plt.ylabel('number of scenes longer than')
@@ -7,9 +7,12 @@ from Scripts.stats_calc import calc_stats
 from Scripts.cities_build import build_cities
 from Scripts.debug_test import test_scene
 from Scripts.io_multiply import multiply_scenes
+from Scripts.io_convert import convert_scenes
+from Scripts.io_serve import serve_scene, receive_ios
 from Scripts.scenes_build import build_scenes
 from Scripts.scenes_run import run_scenes
 from Modules.continent import ContinentName
+from Modules.test_data import test_names_file_name
 
 dataset_url = "http://web.cs.wpi.edu/~claypool/mmsys-dataset/2011/wow/wowah.rar"
 catalina_dataset_path = '/nfs_share/storage-simulations/org-traces/WoWAH'
@@ -45,6 +48,9 @@ if __name__ == '__main__':
                        help="minimum minutes to create a scene (default=1440minutes, a day)")
     build.add_argument('-g', "--gap", type=int, metavar='MINUTES', default=25,
                        help="maximum minutes gap allowed in-scene (default=25minutes)")
+    build.add_argument('-p', '--procs', type=int, default=1, help='number of processes to parse the dataset with')
+    build.add_argument('-r', '--reparse', action='store_true',
+                       help='list and parse the whole dataset, instead of only the days whose files were added or changed (by size or mtime) since the last build')
 
     maps_help = 'Creates the continents maps divided into zones.'
     maps = subparser.add_parser('maps', help=maps_help, description=maps_help)
@@ -68,11 +74,25 @@ if __name__ == '__main__':
                      help='output folder path (default=./IOs/)')
     run.add_argument('-c', "--compress", type=int, choices=range(10), metavar='0-9', default=None, nargs='?', const=5,
                      help="output compression level (defualt=5), no compression if not specified.")
+    run.add_argument('-z', "--compressors", type=int, default=1,
+                     help="number of threads that compress the output of each scene, with -c (default=1)")
     run.add_argument('-k', "--keep", action='store_true', help="don't empty the output folder before running")
+    run.add_argument('-m', "--factor", type=int, default=1,
+                     help="multiply each IO by this factor as it's generated, and write only the multiplied IOs "
+                          "(like multiply with the scene's seed, text only) (default=1)")
+    run.add_argument('-a', "--avatars", type=int, metavar='AVATAR', default=None, nargs='+',
+                     help="multiply (and write) only the IOs of these avatars")
+    run.add_argument('-f', "--format", type=str, choices=['txt', 'bin'], default='txt',
+                     help="output format: text lines or binary records (default=txt)")
+    run.add_argument('-w', "--independent-windows", action='store_true',
+                     help="seed every 10-minute window on its own, so the windows of a scene are run in parallel by --procs")
+    run.add_argument('-r', "--resume", action='store_true',
+                     help="continue each scene from its last checkpoint in the output folder (of a run with the same options)")
 
     test_help = 'Test that the IOs generated should’ve been generated.'
     test = subparser.add_parser('test', help=test_help, description=test_help)
     test.add_argument('scene_num', type=int, metavar='SCENE', help='scene number to test')
+    test.add_argument('-p', '--procs', type=int, default=1, help='number of processes to use')
     test.add_argument('-i', "--input", type=str, metavar='PATH', default='IOs',
                       help='input folder path (default=./IOs/)')
 
@@ -91,6 +111,43 @@ if __name__ == '__main__':
     multiply.add_argument('-i', "--input", type=str, metavar='PATH', default='IOs',
                           help='input folder path (default=./IOs/)')
 
+    convert_help = 'Convert the IOs of scenes between the text and binary formats.'
+    convert = subparser.add_parser('convert', help=convert_help, description=convert_help)
+    convert.add_argument('scene_nums', type=int, metavar='SCENE', nargs='+', help='scene numbers to convert')
+    convert.add_argument('-f', "--format", type=str, choices=['txt', 'bin'], required=True,
+                         help='convert to this format (from the files of the other format)')
+    convert.add_argument('-p', '--procs', type=int, default=1, help='number of processes to use')
+    convert.add_argument('-o', "--output", type=str, metavar='PATH', default=None,
+                         help='output folder path (default=the input path)')
+    convert.add_argument('-c', "--compress", type=int, choices=range(10), metavar='0-9', default=None, nargs='?',
+                         const=5, help="output compression level (defualt=5), no compression if not specified.")
+    convert.add_argument('-i', "--input", type=str, metavar='PATH', default='IOs',
+                         help='input folder path (default=./IOs/)')
+
+    serve_help = 'Stream the IOs of a scene over a socket, at the pace of their timestamps.'
+    serve = subparser.add_parser('serve', help=serve_help, description=serve_help)
+    serve.add_argument('scene_num', type=int, metavar='SCENE', help='scene number to stream')
+    serve.add_argument('-a', "--address", type=str, default='localhost:9000',
+                       help='HOST:PORT, or unix:PATH for a unix socket (default=localhost:9000)')
+    serve.add_argument('-x', "--speed", type=float, default=1,
+                       help='replay speed - 1 for real time, N for N times faster, 0 as fast as possible (default=1)')
+    serve.add_argument('-f', "--format", type=str, choices=['txt', 'bin'], default='txt',
+                       help="stream format: text lines or binary records (default=txt)")
+    serve.add_argument('-i', "--input", type=str, metavar='PATH', default='IOs',
+                       help='input folder path (default=./IOs/)')
+    serve.add_argument('-v', "--live", action='store_true', help="generate the IOs of the scene instead of reading them")
+    serve.add_argument('-s', "--seed", type=int, default=None,
+                       help='seed of a live scene (default=scene_num)')
+    serve.add_argument('-l', "--limit", type=int, metavar='MINUTES', default=None, help='time limit in minutes for a live scene')
+
+    receive_help = 'Receive the IOs streamed by serve (a client for testing).'
+    receive = subparser.add_parser('receive', help=receive_help, description=receive_help)
+    receive.add_argument('-a', "--address", type=str, default='localhost:9000',
+                         help='HOST:PORT, or unix:PATH for a unix socket (default=localhost:9000)')
+    receive.add_argument('-f', "--format", type=str, choices=['txt', 'bin'], default='txt',
+                         help="stream format: text lines or binary records (default=txt)")
+    receive.add_argument('-o', "--output", type=str, metavar='PATH', default=None, help='save the stream to this file')
+
     args = parser.parse_args()
 
     if args.command == 'download':
@@ -103,7 +160,7 @@ if __name__ == '__main__':
             print(
                 f'ERROR: {args.dataset} folder does not exist. You can use the "{colored("download")}" command.')
             exit()
-        build_scenes(args.dataset, args.length, args.gap)
+        build_scenes(args.dataset, args.length, args.gap, args.procs, args.reparse)
     elif args.command == 'run':
         if not os.path.isdir("Scenes"):
             print(f'ERROR: Scenes folder does not exist, try to run "{colored("build")}" first')
@@ -120,10 +177,25 @@ if __name__ == '__main__':
         if args.gif and any(not os.path.isfile(os.path.join("Maps", f"{c.value}.pickle")) for c in ContinentName):
             print(f'ERROR: Continents maps are missing, try to run "{colored("maps")}" first')
             exit()
+        if args.resume and (args.test or args.gif):
+            print('ERROR: --resume can\'t be used with --test or --gif')
+            exit()
+        if args.independent_windows and (args.test or args.gif or args.resume):
+            print('ERROR: --independent-windows can\'t be used with --test, --gif or --resume')
+            exit()
+        if (args.factor > 1 or args.avatars) and (args.format == 'bin' or args.test):
+            print('ERROR: --factor and --avatars can\'t be used with --format bin or --test')
+            exit()
+        if args.factor < 1:
+            print('ERROR: --factor must be at least 1')
+            exit()
         if args.gif is not None:
             args.gif = [str(a) for a in args.gif]
+        if args.avatars is not None:
+            args.avatars = [str(a) for a in args.avatars]
         run_scenes(args.scene_nums, args.output, args.keep, args.compress, args.procs, args.seed, args.limit, args.test,
-                   args.gif)
+                   args.gif, args.format, args.resume, args.independent_windows, args.compressors, args.factor,
+                   args.avatars)
     elif args.command == 'maps':
         create_maps(args.show)
     elif args.command == 'stats':
@@ -136,14 +208,14 @@ if __name__ == '__main__':
         build_cities(args.seed)
     elif args.command == 'test':
         scene_folder = os.path.join(args.input, f'Scene{args.scene_num}')
-        scene_test_data = os.path.join(scene_folder, f"test_data_scene{args.scene_num}.pickle")
+        scene_test_data = os.path.join(scene_folder, test_names_file_name(args.scene_num))
         if not os.path.isdir(scene_folder):
             print(f'ERROR: {scene_folder} does not exist, try to run "{colored("run")}" first')
             exit()
         if not os.path.isfile(scene_test_data):
             print(f'ERROR: {scene_test_data} does not exist, try to run "{colored("run -t")}" first')
             exit()
-        test_scene(args.scene_num, args.input)
+        test_scene(args.scene_num, args.input, args.procs)
     elif args.command == 'multiply':
         for scene_num in args.scene_nums:
             scene_folder = os.path.join(args.input, f'Scene{scene_num}')
@@ -156,3 +228,27 @@ if __name__ == '__main__':
             args.avatars = [str(a) for a in args.avatars]
         multiply_scenes(args.scene_nums, args.input, args.output, args.compress, args.factor, args.seed, args.procs,
                         args.avatars)
+    elif args.command == 'convert':
+        for scene_num in args.scene_nums:
+            scene_folder = os.path.join(args.input, f'Scene{scene_num}')
+            if not os.path.isdir(scene_folder):
+                print(f'ERROR: {scene_folder} does not exist, try to run "{colored("run")}" first')
+                exit()
+        if args.output is None:
+            args.output = args.input
+        convert_scenes(args.scene_nums, args.input, args.output, args.format, args.compress, args.procs)
+    elif args.command == 'serve':
+        if args.live:
+            scene_file = os.path.join('Scenes', f'scene{args.scene_num}.csv')
+            if not os.path.isfile(scene_file):
+                print(f'ERROR: {scene_file} does not exist')
+                exit()
+        else:
+            scene_folder = os.path.join(args.input, f'Scene{args.scene_num}')
+            if not os.path.isdir(scene_folder):
+                print(f'ERROR: {scene_folder} does not exist, try to run "{colored("run")}" first')
+                exit()
+        serve_scene(args.scene_num, args.address, args.speed, None if args.live else args.input, args.format, args.seed,
+                    args.limit)
+    elif args.command == 'receive':
+        receive_ios(args.address, args.format, args.output)